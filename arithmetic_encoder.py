@@ -1,13 +1,35 @@
 import math
+from bisect import bisect_right
 
+import numpy as np
 
-def arithmetic_encode(sequence, probabilities):
+from profiling import add_bytes, instrument
+
+# the integer coder keeps low and high as CODE_BITS bit integers; counts are
+# scaled to at most MAX_TOTAL so every symbol keeps a non-empty range
+CODE_BITS = 32
+FULL = 1 << CODE_BITS
+HALF = FULL >> 1
+QUARTER = FULL >> 2
+MAX_TOTAL = 1 << 16
+
+
+def build_cumulative_probs(probabilities):
     # Calculate cumulative probabilities
     cumulative_probs = {}
     cumulative = 0.0
     for char, prob in probabilities.items():
         cumulative_probs[char] = (cumulative, cumulative + prob)
         cumulative += prob
+    return cumulative_probs
+
+
+@instrument('arithmetic encoding')
+def arithmetic_encode(sequence, probabilities, cumulative_probs=None):
+    # cumulative_probs can be passed in to reuse a table built earlier
+    add_bytes(len(sequence))
+    if cumulative_probs is None:
+        cumulative_probs = build_cumulative_probs(probabilities)
 
     # Encoding process
     low, high = 0.0, 1.0
@@ -25,22 +47,21 @@ def arithmetic_encode(sequence, probabilities):
     encoded_value = (low + high) / 2
 
     # Calculate compression ratio
-    # Number of bits required to encode the value
-    num_bits_encoded = -math.log2(high - low)
+    # Number of bits required to encode the value (the interval can shrink to
+    # nothing once the sequence outgrows float precision)
+    num_bits_encoded = -math.log2(high - low) if high > low else math.inf
     # Original size in bits (assuming 8 bits per character)
     original_size = len(sequence) * 8
     # Compression ratio
-    compression_ratio = original_size / num_bits_encoded
+    compression_ratio = original_size / num_bits_encoded if num_bits_encoded else 0.0
 
     return encoded_value, compression_ratio
-def arithmetic_decode(encoded_value, probabilities, sequence_length):
+@instrument('arithmetic decoding')
+def arithmetic_decode(encoded_value, probabilities, sequence_length, cumulative_probs=None):
     """Decode an encoded value using Arithmetic Decoding."""
-    cumulative_probs = {}
-    low = 0.0
-
-    for char, prob in probabilities.items():
-        cumulative_probs[char] = (low, low + prob)
-        low += prob
+    add_bytes(sequence_length)
+    if cumulative_probs is None:
+        cumulative_probs = build_cumulative_probs(probabilities)
 
     decoded_sequence = ""
     value = encoded_value
@@ -51,3 +72,106 @@ def arithmetic_decode(encoded_value, probabilities, sequence_length):
                 value = (value - low) / (high - low)
                 break
     return decoded_sequence
+
+
+def build_cumulative_counts(frequency):
+    # integer counterpart of build_cumulative_probs: {char: (low, high)} with
+    # counts scaled down to at most MAX_TOTAL in total, each at least 1
+    total = sum(frequency.values())
+    scale = min(1.0, (MAX_TOTAL - len(frequency)) / max(total, 1))
+    cumulative_counts = {}
+    cumulative = 0
+    for char, count in frequency.items():
+        count = max(1, int(count * scale))
+        cumulative_counts[char] = (cumulative, cumulative + count)
+        cumulative += count
+    return cumulative_counts
+
+
+@instrument('arithmetic encoding (packed)')
+def arithmetic_encode_packed(sequence, cumulative_counts):
+    # finite precision arithmetic coding: the interval is kept in CODE_BITS
+    # bit integers and renormalised bit by bit, so messages of any length
+    # decode exactly; returns the packed bits and their number
+    add_bytes(len(sequence))
+    if not sequence:
+        return b'', 0
+    total = max(high for _, high in cumulative_counts.values())
+    low, high = 0, FULL - 1
+    pending = 0  # opposite bits owed once the interval leaves the middle
+    bits = []
+    for char in sequence:
+        if char not in cumulative_counts:
+            raise ValueError(
+                f"Character '{char}' not found in the probability dictionary.")
+        char_low, char_high = cumulative_counts[char]
+        width = high - low + 1
+        high = low + width * char_high // total - 1
+        low = low + width * char_low // total
+        while True:
+            if high < HALF:
+                bits.append(0)
+                bits.extend([1] * pending)
+                pending = 0
+            elif low >= HALF:
+                bits.append(1)
+                bits.extend([0] * pending)
+                pending = 0
+                low -= HALF
+                high -= HALF
+            elif low >= QUARTER and high < HALF + QUARTER:
+                pending += 1
+                low -= QUARTER
+                high -= QUARTER
+            else:
+                break
+            low = 2 * low
+            high = 2 * high + 1
+
+    # two more bits pick a point inside the final interval
+    pending += 1
+    bits.append(0 if low < QUARTER else 1)
+    bits.extend([bits[-1] ^ 1] * pending)
+    return np.packbits(np.array(bits, dtype=np.uint8)).tobytes(), len(bits)
+
+
+@instrument('arithmetic decoding (packed)')
+def arithmetic_decode_packed(packed, cumulative_counts, sequence_length):
+    add_bytes(sequence_length)
+    if not sequence_length:
+        return ''
+    chars = list(cumulative_counts)
+    lows = [low for low, _ in cumulative_counts.values()]
+    total = max(high for _, high in cumulative_counts.values())
+    # bits past the end of the message read as 0
+    bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).tolist() + [0] * CODE_BITS
+    value = int(''.join(map(str, bits[:CODE_BITS])), 2)
+    pos = CODE_BITS
+    low, high = 0, FULL - 1
+    decoded = []
+    for _ in range(sequence_length):
+        width = high - low + 1
+        target = ((value - low + 1) * total - 1) // width
+        char = chars[bisect_right(lows, target) - 1]
+        decoded.append(char)
+        char_low, char_high = cumulative_counts[char]
+        high = low + width * char_high // total - 1
+        low = low + width * char_low // total
+        while True:
+            if high < HALF:
+                pass
+            elif low >= HALF:
+                low -= HALF
+                high -= HALF
+                value -= HALF
+            elif low >= QUARTER and high < HALF + QUARTER:
+                low -= QUARTER
+                high -= QUARTER
+                value -= QUARTER
+            else:
+                break
+            low = 2 * low
+            high = 2 * high + 1
+            value = 2 * value + (bits[pos] if pos < len(bits) else 0)
+            pos += 1
+    return ''.join(decoded)
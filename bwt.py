@@ -0,0 +1,96 @@
+# Burrows-Wheeler transform and move-to-front coding
+import numpy as np
+
+from profiling import add_bytes, instrument
+
+
+def _radix_argsort(keys):
+    # stable argsort of integer keys in [0, 2**32) as two passes over 16 bit
+    # digits, low first; numpy sorts 16 bit integers by radix sort, so each
+    # pass is linear
+    order = np.argsort((keys & 0xFFFF).astype(np.uint16), kind='stable')
+    if keys.size and keys.max() > 0xFFFF:
+        order = order[np.argsort((keys[order] >> 16).astype(np.uint16), kind='stable')]
+    return order
+
+
+def _rotation_order(codes):
+    # sorts the cyclic rotations by prefix doubling: after the round for k
+    # the ranks order the rotations by their first 2k symbols; the order by
+    # the second half of the pairs comes from the previous order shifted by
+    # k, so each round is one linear radix sort by the first half and log n
+    # rounds sort in O(n log n)
+    n = codes.size
+    rank = np.unique(codes, return_inverse=True)[1].reshape(-1).astype(np.int64)
+    order = _radix_argsort(rank)
+    k = 1
+    while k < n:
+        by_second = (order - k) % n  # sorted by rank[i + k]
+        order = by_second[_radix_argsort(rank[by_second])]
+        first, second = rank[order], rank[(order + k) % n]
+        changed = (first[1:] != first[:-1]) | (second[1:] != second[:-1])
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.concatenate(([0], np.cumsum(changed)))
+        if rank[order[-1]] == n - 1:  # every rotation is distinct already
+            break
+        k *= 2
+    return order
+
+
+@instrument('BWT encoding')
+def bwt_encode(codes):
+    # returns the last column of the sorted rotations and the row holding
+    # the original sequence
+    codes = np.asarray(codes)
+    add_bytes(codes.size)
+    if codes.size == 0:
+        return codes, 0
+    order = _rotation_order(codes)
+    last_column = codes[(order - 1) % codes.size]
+    primary = int(np.flatnonzero(order == 0)[0])
+    return last_column, primary
+
+
+@instrument('BWT decoding')
+def bwt_decode(last_column, primary):
+    last_column = np.asarray(last_column)
+    add_bytes(last_column.size)
+    # next_row[i] is the row that starts one symbol later than row i
+    next_row = np.argsort(last_column, kind='stable').tolist()
+    symbols = last_column.tolist()
+    decoded = []
+    row = primary
+    for _ in range(len(symbols)):
+        row = next_row[row]
+        decoded.append(symbols[row])
+    return np.array(decoded, dtype=last_column.dtype)
+
+
+@instrument('MTF encoding')
+def mtf_encode(symbols, alphabet):
+    # replaces each symbol with its position in a list of recently used
+    # symbols, so the repeats BWT groups together become runs of zeros
+    table = list(alphabet)
+    add_bytes(len(symbols))
+    ranks = []
+    for symbol in symbols:
+        rank = table.index(symbol)
+        ranks.append(rank)
+        if rank:
+            del table[rank]
+            table.insert(0, symbol)
+    return ranks
+
+
+@instrument('MTF decoding')
+def mtf_decode(ranks, alphabet):
+    table = list(alphabet)
+    symbols = []
+    for rank in ranks:
+        symbol = table[rank]
+        symbols.append(symbol)
+        if rank:
+            del table[rank]
+            table.insert(0, symbol)
+    add_bytes(len(symbols))
+    return symbols
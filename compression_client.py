@@ -0,0 +1,121 @@
+# client for compression_server.py and a load generator measuring latency
+# and throughput; without --host/--unix it starts a local stand-in server
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import tempfile
+import time
+
+from compression_server import CODECS, CompressionServer, percentile
+
+
+class CompressionClient:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.lock = asyncio.Lock()  # one request in flight per connection
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, op, codec, data=b''):
+        name = codec.encode()
+        async with self.lock:
+            self.writer.write(struct.pack('>cB', op, len(name)) + name +
+                              struct.pack('>Q', len(data)))
+            self.writer.write(data)
+            await self.writer.drain()
+            status, length = struct.unpack('>BQ', await self.reader.readexactly(9))
+            payload = await self.reader.readexactly(length)
+        if status:
+            raise RuntimeError(payload.decode(errors='replace'))
+        return payload
+
+    async def compress(self, codec, data):
+        return await self.request(b'C', codec, data)
+
+    async def decompress(self, codec, data):
+        return await self.request(b'D', codec, data)
+
+    async def metrics(self):
+        return json.loads(await self.request(b'M', ''))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def make_payload(size, alphabet=b'aaaabbbccd 0011\n'):
+    # skewed text-like data so the codecs have something to compress
+    return bytes(random.choices(alphabet, k=size))
+
+
+async def worker(connect, codec, payload, count, latencies):
+    client = await connect()
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            compressed = await client.compress(codec, payload)
+            restored = await client.decompress(codec, compressed)
+            latencies.append(time.perf_counter() - started)
+            if restored != payload:
+                raise RuntimeError(f"{codec} round trip mismatch")
+    finally:
+        await client.close()
+    return len(compressed)
+
+
+async def load_test(args):
+    server = None
+    unix_path = args.unix
+    if not args.host and not unix_path:
+        # local stand-in for the real service
+        unix_path = os.path.join(tempfile.mkdtemp(), 'compression.sock')
+        server = CompressionServer(args.workers)
+        await server.start(unix_path=unix_path)
+
+    def connect():
+        return CompressionClient.connect(args.host, args.port, unix_path)
+
+    payload = make_payload(args.size)
+    try:
+        for codec in args.codecs:
+            latencies = []
+            started = time.perf_counter()
+            sizes = await asyncio.gather(*[
+                worker(connect, codec, payload, args.requests, latencies)
+                for _ in range(args.concurrency)])
+            elapsed = time.perf_counter() - started
+            total = args.size * len(latencies)
+            print(f"{codec}: {len(latencies)} round trips, "
+                  f"ratio {args.size / max(sizes[0], 1):.2f}, "
+                  f"p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:.2f} ms, "
+                  f"{total / elapsed / 1e6:.2f} MB/s")
+        client = await connect()
+        print(json.dumps(await client.metrics(), indent=2))
+        await client.close()
+    finally:
+        if server is not None:
+            await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compression server load generator")
+    parser.add_argument('--host', help="server host, a local server is started if omitted")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="server Unix socket path")
+    parser.add_argument('--codecs', nargs='+', default=sorted(CODECS))
+    parser.add_argument('--size', type=int, default=64 << 10, help="bytes per request")
+    parser.add_argument('--requests', type=int, default=20, help="round trips per connection")
+    parser.add_argument('--concurrency', type=int, default=4, help="parallel connections")
+    parser.add_argument('--workers', type=int, help="worker processes of the local server")
+    asyncio.run(load_test(parser.parse_args()))
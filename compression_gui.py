@@ -4,7 +4,7 @@ import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QComboBox, QTextEdit,
     QPushButton, QWidget, QTableWidget, QTableWidgetItem, QGridLayout, QHeaderView,
-    QMessageBox
+    QMessageBox, QCheckBox, QFileDialog
 )
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QIcon
@@ -15,6 +15,9 @@ from huffman import build_frequency_dict, build_huffman_tree, generate_huffman_c
 from huffman import decode_huffman
 
 from rle import RLE, RLE_decode  # RLE module
+from lossy import (nu_scalar_quantize, nu_scalar_dequantize,  # NU Scalar
+                   rate_distortion_curve, format_rate_distortion)
+import profiling
 
 
 def simplify_ratio(original_size, encoded_size):
@@ -22,51 +25,6 @@ def simplify_ratio(original_size, encoded_size):
     return f"{original_size // gcd_value}:{encoded_size // gcd_value}"
 
 
-def lbg_algorithm(data, num_levels):
-    data = np.array(data)
-    epsilon = 1e-6
-    levels = [np.mean(data)]
-    while len(levels) < num_levels:
-        levels = [level + epsilon for level in levels] + \
-            [level - epsilon for level in levels]
-        while True:
-            clusters = {level: [] for level in levels}
-            for point in data:
-                nearest_level = min(levels, key=lambda x: abs(point - x))
-                clusters[nearest_level].append(point)
-            new_levels = [
-                np.mean(clusters[level]) if clusters[level] else level for level in levels]
-            if np.allclose(new_levels, levels, atol=epsilon):
-                break
-            levels = new_levels
-    boundaries = [(levels[i] + levels[i + 1]) /
-                  2 for i in range(len(levels) - 1)]
-    return levels, boundaries
-
-
-def lbg_compression(data, num_levels):
-    levels, boundaries = lbg_algorithm(data, num_levels)
-    compressed_data = []
-    for point in data:
-        for i, boundary in enumerate(boundaries):
-            if point <= boundary:
-                compressed_data.append(levels[i])
-                break
-        else:
-            compressed_data.append(levels[-1])
-    return compressed_data, levels
-
-
-def decode_nu_scalar(compressed_data, levels):
-    # Decompress by mapping each value back to its closest level
-    decompressed_data = []
-    for value in compressed_data:
-        # Find the closest quantization level
-        closest_level = min(levels, key=lambda level: abs(value - level))
-        decompressed_data.append(closest_level)
-    return decompressed_data
-
-
 class CompressionGUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -99,6 +57,12 @@ class CompressionGUI(QMainWindow):
         self.prob_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.prob_table.verticalHeader().setVisible(False)
 
+        self.levels_label = QLabel("Quantization Levels:")
+        self.levels_label.setAlignment(Qt.AlignCenter)
+        self.levels_combo = QComboBox()
+        self.levels_combo.addItems([str(2 ** i) for i in range(1, 9)])
+        self.levels_combo.setCurrentText("4")
+
         self.generate_table_button = QPushButton("Generate Probability Table")
         self.generate_table_button.clicked.connect(self.generate_table)
         self.generate_table_button.setEnabled(False)
@@ -115,17 +79,33 @@ class CompressionGUI(QMainWindow):
         self.decode_button = QPushButton("Decode")
         self.decode_button.clicked.connect(self.decode_text)
 
+        self.profile_checkbox = QCheckBox("Record Phase Timings")
+        self.profile_checkbox.stateChanged.connect(self.toggle_profiling)
+        self.export_stats_button = QPushButton("Export Stats")
+        self.export_stats_button.clicked.connect(self.export_stats)
+
+        self.stats_label = QLabel("Phase Stats:")
+        self.stats_label.setAlignment(Qt.AlignCenter)
+        self.stats_text = QTextEdit()
+        self.stats_text.setReadOnly(True)
+
         self.layout.addWidget(self.method_label, 0, 0)
         self.layout.addWidget(self.method_combo, 0, 1, 1, 2)
         self.layout.addWidget(self.input_label, 1, 0)
         self.layout.addWidget(self.input_text, 1, 1, 1, 2)
         self.layout.addWidget(self.table_label, 2, 0)
         self.layout.addWidget(self.prob_table, 2, 1, 1, 2)
+        self.layout.addWidget(self.levels_label, 2, 0)
+        self.layout.addWidget(self.levels_combo, 2, 1, 1, 2)
         self.layout.addWidget(self.generate_table_button, 3, 0, 1, 3)
         self.layout.addWidget(self.output_label, 4, 0)
         self.layout.addWidget(self.output_text, 4, 1, 1, 2)
         self.layout.addWidget(self.encode_button, 5, 0, 1, 3)
         self.layout.addWidget(self.decode_button, 6, 0, 1, 3)
+        self.layout.addWidget(self.profile_checkbox, 7, 0)
+        self.layout.addWidget(self.export_stats_button, 7, 1, 1, 2)
+        self.layout.addWidget(self.stats_label, 8, 0)
+        self.layout.addWidget(self.stats_text, 8, 1, 1, 2)
 
         container = QWidget()
         container.setLayout(self.layout)
@@ -221,6 +201,10 @@ class CompressionGUI(QMainWindow):
         QMessageBox {
             background: #3c3f41;
         }
+        QCheckBox {
+            font-size: 13px;
+            color: #ffffff;
+        }
     """)
 
     def switch_method(self):
@@ -235,6 +219,27 @@ class CompressionGUI(QMainWindow):
             self.prob_table.setEnabled(False)
             self.table_label.setVisible(False)
             self.prob_table.setVisible(False)
+        self.levels_label.setVisible(method == "NU Scalar")
+        self.levels_combo.setVisible(method == "NU Scalar")
+
+    def toggle_profiling(self):
+        if self.profile_checkbox.isChecked():
+            profiling.enable()
+        else:
+            profiling.disable()
+
+    def show_stats(self):
+        if profiling.enabled:
+            self.stats_text.setText(profiling.format_stats())
+
+    def export_stats(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Export Stats", "stats.json", "JSON Files (*.json)")
+        if path:
+            try:
+                profiling.export_json(path)
+            except OSError as e:
+                QMessageBox.critical(self, "Export Error", str(e))
 
     def generate_table(self):
         sequence = self.input_text.toPlainText()
@@ -334,13 +339,18 @@ class CompressionGUI(QMainWindow):
 
         elif method == "NU Scalar":
             try:
-                data = list(map(float, input_text.split()))
-                num_levels = 4  # For simplicity, using 4 quantization levels
-                compressed_data, levels = lbg_compression(data, num_levels)
+                data = np.array(input_text.split(), dtype=float)
+                num_levels = int(self.levels_combo.currentText())
+                # one training run gives the codebook for every level count up to num_levels
+                curve = rate_distortion_curve(data, num_levels, entropy_coded=True)
+                levels = curve[-1]['codebook']
+                compressed_data = nu_scalar_dequantize(
+                    nu_scalar_quantize(data, levels), levels).tolist()
                 # Store compressed data for later decompression
                 self.compressed_data = compressed_data
-                self.levels = levels  # Store levels for decompression
-                result = f"Compressed Data: {compressed_data}\nQuantization Levels: {levels}"
+                self.levels = levels.tolist()  # Store levels for decompression
+                result = (f"Compressed Data: {compressed_data}\nQuantization Levels: {self.levels}"
+                          f"\n\nRate-Distortion:\n{format_rate_distortion(curve)}")
             except ValueError:
                 QMessageBox.warning(
                     self, "Error", "Please enter valid comma-separated numbers.")
@@ -348,6 +358,8 @@ class CompressionGUI(QMainWindow):
 
             self.output_text.setText(result)
 
+        self.show_stats()
+
     def decode_text(self):
         method = self.method_combo.currentText()
 
@@ -411,15 +423,19 @@ class CompressionGUI(QMainWindow):
 
         elif method == "NU Scalar":
             try:
-                compressed_data = list(
-                    map(float, self.input_text.toPlainText().split()))
-                decompressed_data = decode_nu_scalar(
-                    compressed_data, self.levels)
+                compressed_data = np.array(
+                    self.input_text.toPlainText().split(), dtype=float)
+                # each value goes back to its closest level
+                levels = np.asarray(self.levels)
+                decompressed_data = nu_scalar_dequantize(
+                    nu_scalar_quantize(compressed_data, levels), levels).tolist()
                 self.output_text.setText(
                     f"Decompressed Data:\n{decompressed_data}")
             except Exception as e:
                 QMessageBox.critical(self, "Decoding Error", str(e))
 
+        self.show_stats()
+
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
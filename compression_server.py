@@ -0,0 +1,264 @@
+# asyncio server exposing the codecs over TCP or a Unix socket
+#
+# request:  op (b'C' compress, b'D' decompress, b'M' metrics), codec name
+#           length (1 byte), codec name, body length (8 bytes), body
+# response: status (0 ok, 1 error), payload length (8 bytes), payload
+import argparse
+import asyncio
+import contextlib
+import json
+import struct
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from huffman import build_huffman_tree, generate_code_table, encode_text_packed, decode_huffman_packed
+from varint import write_varint, read_varint
+
+READ_CHUNK = 1 << 16  # bytes read from the socket at a time
+MAX_BODY = 64 << 20  # largest request body accepted
+MAX_JOBS = 8  # requests allowed on the process pool at once
+MAX_BUFFERED = 4 * MAX_BODY  # request body bytes held in memory at once, over all connections
+LATENCY_SAMPLES = 10000  # latencies kept per codec and operation
+
+
+def huffman_compress(data):
+    # header: symbol count, then (byte, frequency) per symbol, then the length;
+    # the tree is rebuilt from the frequencies, which gives the same codes
+    frequency = {chr(byte): count for byte, count in sorted(Counter(data).items())}
+    header = struct.pack('>H', len(frequency)) + b''.join(
+        struct.pack('>BI', ord(char), count) for char, count in frequency.items())
+    if not frequency:
+        return header + struct.pack('>Q', 0)
+    code_table = generate_code_table(build_huffman_tree(frequency))
+    packed, _ = encode_text_packed(data, code_table)
+    return header + struct.pack('>Q', len(data)) + packed
+
+
+def huffman_decompress(data):
+    symbol_count, = struct.unpack_from('>H', data)
+    pos = 2
+    frequency = {}
+    for _ in range(symbol_count):
+        byte, count = struct.unpack_from('>BI', data, pos)
+        frequency[chr(byte)] = count
+        pos += 5
+    length, = struct.unpack_from('>Q', data, pos)
+    if not length:
+        return b''
+    packed = data[pos + 8:]
+    tree = build_huffman_tree(frequency)
+    decoded = decode_huffman_packed(packed, len(packed) * 8, tree)
+    return decoded[:length].encode('latin-1')
+
+
+def rle_compress(data):
+    # runs as (varint length, byte) pairs; rle.RLE writes its counts as
+    # decimal digits, which cannot be told apart from digit bytes
+    codes = np.frombuffer(data, dtype=np.uint8)
+    if not codes.size:
+        return b''
+    starts = np.flatnonzero(np.diff(codes, prepend=codes[0] ^ 1))
+    lengths = np.diff(np.append(starts, codes.size))
+    out = bytearray()
+    for length, byte in zip(lengths.tolist(), codes[starts].tolist()):
+        out += write_varint(length)
+        out.append(byte)
+    return bytes(out)
+
+
+def rle_decompress(data):
+    lengths, values = [], []
+    pos = 0
+    while pos < len(data):
+        length, pos = read_varint(data, pos)
+        lengths.append(length)
+        values.append(data[pos])
+        pos += 1
+    return np.repeat(np.array(values, dtype=np.uint8), lengths).tobytes()
+
+
+# name -> (compress, decompress), both taking and returning bytes
+CODECS = {
+    'huffman': (huffman_compress, huffman_decompress),
+    'rle': (rle_compress, rle_decompress),
+}
+
+
+def run_codec(codec, op, data):
+    # runs in a worker process
+    compress, decompress = CODECS[codec]
+    return compress(data) if op == b'C' else decompress(data)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class Metrics:  # per codec and operation request counts, bytes and latency
+    def __init__(self):
+        self.requests = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.bytes_in = defaultdict(int)
+        self.bytes_out = defaultdict(int)
+        self.latencies = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+
+    def record(self, key, size_in, size_out, latency, ok=True):
+        self.requests[key] += 1
+        self.errors[key] += not ok
+        self.bytes_in[key] += size_in
+        self.bytes_out[key] += size_out
+        self.latencies[key].append(latency)
+
+    def summary(self):
+        return {key: {
+            'requests': self.requests[key],
+            'errors': self.errors[key],
+            'bytes_in': self.bytes_in[key],
+            'bytes_out': self.bytes_out[key],
+            'p50_ms': percentile(self.latencies[key], 50) * 1000,
+            'p99_ms': percentile(self.latencies[key], 99) * 1000,
+        } for key in self.requests}
+
+
+class ByteBudget:  # a semaphore counting bytes instead of holders
+    def __init__(self, limit):
+        self.limit = limit
+        self.available = limit
+        self.changed = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def hold(self, size):
+        # size must be at most limit, or this waits forever
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.available >= size)
+            self.available -= size
+        try:
+            yield
+        finally:
+            async with self.changed:
+                self.available += size
+                self.changed.notify_all()
+
+
+class CompressionServer:
+    def __init__(self, workers=None, max_jobs=MAX_JOBS, max_buffered=MAX_BUFFERED):
+        self.pool = ProcessPoolExecutor(workers)
+        # bounds the work queued on the pool; a connection waiting for a slot
+        # reads no further requests, which pushes back on its client; bodies
+        # are read before taking a slot so slow uploads never hold one
+        self.jobs = asyncio.Semaphore(max_jobs)
+        # bounds the memory of bodies being read or processed: a connection
+        # reserves its body's length before reading it, and waits (reading
+        # nothing) while other connections hold the budget
+        self.buffered = ByteBudget(max_buffered)
+        self.metrics = Metrics()
+        self.server = None
+        self.connections = {}  # handler task -> its writer, for shutdown
+
+    async def start(self, host='127.0.0.1', port=8765, unix_path=None):
+        if unix_path:
+            self.server = await asyncio.start_unix_server(self.handle, unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        # closing the transports makes idle handlers see end of stream and return
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+        self.pool.shutdown()
+
+    async def read_body(self, reader, length):
+        chunks = []
+        remaining = length
+        while remaining:
+            chunk = await reader.read(min(READ_CHUNK, remaining))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b''.join(chunks), length)
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    async def respond(self, writer, status, payload):
+        writer.write(struct.pack('>BQ', status, len(payload)))
+        for start in range(0, len(payload), READ_CHUNK):
+            writer.write(payload[start:start + READ_CHUNK])
+            await writer.drain()  # waits while the client is slow to read
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    op, name_length = struct.unpack('>cB', await reader.readexactly(2))
+                except asyncio.IncompleteReadError:
+                    break  # client closed the connection
+                codec = (await reader.readexactly(name_length)).decode()
+                length, = struct.unpack('>Q', await reader.readexactly(8))
+
+                if op == b'M' and not length:
+                    await self.respond(writer, 0, json.dumps(
+                        {f'{c}:{o}': v for (c, o), v in self.metrics.summary().items()}).encode())
+                    continue
+                # a metrics request with a body is rejected too, as the body
+                # would be read as the next request
+                if (op not in (b'C', b'D') or codec not in CODECS
+                        or length > min(MAX_BODY, self.buffered.limit)):
+                    await self.respond(writer, 1, b'bad request')
+                    break
+
+                # the body counts against the budget until its job is done;
+                # the result is sent after releasing it
+                async with self.buffered.hold(length):
+                    body = await self.read_body(reader, length)
+                    started = time.perf_counter()
+                    async with self.jobs:
+                        key = (codec, op.decode())
+                        try:
+                            result = await loop.run_in_executor(self.pool, run_codec, codec, op, body)
+                        except Exception as e:
+                            self.metrics.record(key, length, 0, time.perf_counter() - started, ok=False)
+                            await self.respond(writer, 1, str(e).encode())
+                            continue
+                        self.metrics.record(key, length, len(result), time.perf_counter() - started)
+                    body = None
+                await self.respond(writer, 0, result)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+
+async def serve(host, port, unix_path, workers):
+    server = CompressionServer(workers)
+    await server.start(host, port, unix_path)
+    print(f"Serving {', '.join(CODECS)} on {unix_path or f'{host}:{port}'}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compression server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="serve on this Unix socket path instead")
+    parser.add_argument('--workers', type=int, help="worker processes")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.unix, args.workers))
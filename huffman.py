@@ -2,78 +2,356 @@
 import heapq
 from collections import Counter
 
+import numpy as np
 
-class HuffmanNode:  # represents the nodes in the huffman tree
-    def __init__(self, char, freq):
-        self.char = char  # characters stored in the nodes
-        self.freq = freq  # frequency of the characters
-        self.lo = None  # left child node
-        self.hi = None  # right child node
+from profiling import add_bytes, instrument
 
-    def __lt__(self, other):
-        return self.freq < other.freq  # compares the heap ordering by frequency
+PACK_CHUNK = 1 << 22  # symbols packed per pass, bounds temporary memory
+DECODE_CHUNK = 1 << 22  # bits decoded per pass, bounds temporary memory
+DECODE_TABLE_BITS = 20  # longer codes fall back to walking the tree (at most 25)
 
 
+class HuffmanTree:  # the huffman tree stored as parallel lists indexed by node
+    __slots__ = ('chars', 'freqs', 'lo', 'hi', 'root')
+
+    def __init__(self):
+        self.chars = []  # character of each leaf, None for merged nodes
+        self.freqs = []  # frequency of each node
+        self.lo = []  # index of the left child, -1 for leaves
+        self.hi = []  # index of the right child, -1 for leaves
+        self.root = -1  # index of the root node
+
+    def add_node(self, char, freq, lo=-1, hi=-1):
+        self.chars.append(char)
+        self.freqs.append(freq)
+        self.lo.append(lo)
+        self.hi.append(hi)
+        return len(self.freqs) - 1
+
+
+@instrument('frequency counting')
 def build_frequency_dict(text):
+    add_bytes(len(text))
     return Counter(text)  # counts the occurrences of each character in text
 
 
+@instrument('tree build')
 def build_huffman_tree(frequency):
-    heap = [HuffmanNode(char, freq) for char, freq in frequency.items()]
+    if not frequency:
+        return None
+
+    tree = HuffmanTree()
+    # leaves are added in character order and the heap breaks frequency ties on
+    # the node index, so the same input always gives the same tree
+    heap = [(freq, tree.add_node(char, freq))
+            for char, freq in sorted(frequency.items())]
     heapq.heapify(heap)  # Transforms the list into a min-heap
 
     while len(heap) > 1:  # Iterates until there’s only one node left, the root
-        lo = heapq.heappop(heap)  # Pops out the node with least frequency
+        lo_freq, lo = heapq.heappop(heap)  # Pops out the node with least frequency
         # Pops out the second least frequent character node
-        hi = heapq.heappop(heap)
-        # Create a new merged node with combined frequency
-        merged = HuffmanNode(None, lo.freq + hi.freq)
+        hi_freq, hi = heapq.heappop(heap)
 
         # Assign the higher frequency node to the left (lo), and the lower to the right (hi)
-        if lo.freq >= hi.freq:
-            merged.lo = lo  # The higher frequency node goes to the left
-            merged.hi = hi  # The lower frequency node goes to the right
-        else:
-            merged.lo = hi  # The higher frequency node goes to the left
-            merged.hi = lo  # The lower frequency node goes to the right
+        if lo_freq < hi_freq:
+            lo, hi = hi, lo
+        # Create a new merged node with combined frequency
+        merged = tree.add_node(None, lo_freq + hi_freq, lo, hi)
+        heapq.heappush(heap, (lo_freq + hi_freq, merged))  # Push the merged node into the heap
 
-        heapq.heappush(heap, merged)  # Push the merged node into the heap
-    return heap[0] if heap else None  # In the end, return the root node
+    tree.root = heap[0][1]  # In the end, the last node left is the root
+    return tree
 
 
-def generate_huffman_codes(node, code='', huffman_code=None):
-    if huffman_code is None:
-        huffman_code = {}
+@instrument('code generation')
+def generate_code_table(tree):
+    # walks the tree with an explicit stack and returns {char: (code, length)}
+    # where code is the integer value of the bit string
+    code_table = {}
+    if tree is None:
+        return code_table
+    if tree.lo[tree.root] < 0:
+        # a single character still needs one bit per occurrence
+        return {tree.chars[tree.root]: (0, 1)}
+
+    stack = [(tree.root, 0, 0)]
+    while stack:
+        node, code, length = stack.pop()
+        if tree.lo[node] < 0:
+            code_table[tree.chars[node]] = (code, length)
+        else:
+            stack.append((tree.hi[node], (code << 1) | 1, length + 1))
+            stack.append((tree.lo[node], code << 1, length + 1))
+
+    return code_table
 
-    if node.char is not None:
-        # if it is a leaf node it stores the code for the characcter
-        huffman_code[node.char] = code
-    else:
-        # traverses through the left child and updates their code
-        generate_huffman_codes(node.lo, code + '0', huffman_code)
-    # traverses through the right child and updates their code
-        generate_huffman_codes(node.hi, code + '1', huffman_code)
 
-    return huffman_code  # returns dictionary for codes
+def generate_huffman_codes(tree):
+    # same codes as generate_code_table, written out as strings of '0' and '1'
+    return {char: format(code, '0%db' % length)
+            for char, (code, length) in generate_code_table(tree).items()}
 
 
+@instrument('bit emission')
 def encode_text(text, huffman_code):
     # replaces each char with its code
+    add_bytes(len(text))
     return ''.join(huffman_code[char] for char in text)
 
 
-def decode_huffman(encoded_text, root):
+def _symbol_array(text):
+    # views the input as an array of code points without a per-symbol Python
+    # loop; bytes count as latin-1 characters, which decode back as str
+    if isinstance(text, str):
+        try:
+            return np.frombuffer(text.encode('latin-1'), dtype=np.uint8)
+        except UnicodeEncodeError:
+            return np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+    if isinstance(text, (bytes, bytearray, memoryview)):
+        return np.frombuffer(text, dtype=np.uint8)
+    raise TypeError("Huffman text coding needs str or bytes input.")
+
+
+def build_code_lookup(huffman_code):
+    # turns the code dictionary into lookup tables indexed by symbol value:
+    # codes and lengths of single symbols, and for byte alphabets with codes
+    # of at most 32 bits also of symbol pairs (indexed by first | second << 8)
+    # a length of 0 marks a symbol that has no code
+    # accepts both the string codes and the (code, length) pairs
+    _check_symbols(huffman_code)
+    keys = [ord(char) for char in huffman_code]
+    codes = [(int(code, 2) if code else 0, len(code)) if isinstance(code, str)
+             else code for code in huffman_code.values()]
+    size = max(max(keys) + 1, 256)
+    lut_codes = np.zeros(size, dtype=np.uint64)
+    lut_lengths = np.zeros(size, dtype=np.uint8)
+    for key, (code, length) in zip(keys, codes):
+        lut_codes[key] = code if length <= 64 else 0
+        lut_lengths[key] = length
+
+    pair_codes = pair_lengths = None
+    if size == 256 and lut_lengths.max() <= 32:
+        first, second = np.meshgrid(np.arange(256), np.arange(256))  # [second, first]
+        pair_codes = ((lut_codes[first] << lut_lengths[second].astype(np.uint64))
+                      | lut_codes[second]).reshape(-1)
+        pair_lengths = (lut_lengths[first] + lut_lengths[second]).reshape(-1)
+        # a pair with an unknown symbol must still be reported as unknown
+        pair_lengths[((lut_lengths[first] == 0) | (lut_lengths[second] == 0)).reshape(-1)] = 0
+    return lut_codes, lut_lengths, pair_codes, pair_lengths
+
+
+@instrument('bit emission (packed)')
+def encode_text_packed(text, huffman_code, lookup=None):
+    # same bit stream as encode_text, but packed 8 bits per byte using numpy
+    # lookup can hold build_code_lookup(huffman_code) to skip rebuilding it
+    symbols = _symbol_array(text)
+    add_bytes(symbols.size)
+    if symbols.size == 0:
+        return b'', 0
+
+    if lookup is None:
+        lookup = build_code_lookup(huffman_code)
+    lut_codes, lut_lengths, pair_codes, pair_lengths = lookup
+    if symbols.max() >= lut_lengths.size:
+        raise KeyError("Symbol not found in the Huffman code table.")
+    if lut_lengths.max() > 64:  # each code must fit in a 64 bit word
+        code_strings = {char: code if isinstance(code, str) else format(code[0], '0%db' % code[1])
+                        for char, code in huffman_code.items()}
+        if not isinstance(text, str):
+            text = bytes(text).decode('latin-1')
+        bits = np.frombuffer(encode_text(text, code_strings).encode(), dtype=np.uint8)
+        return np.packbits(bits - 48).tobytes(), bits.size
+
+    if pair_codes is not None and symbols.dtype == np.uint8 and symbols.size > 1:
+        # one lookup per two bytes, read as little endian 16 bit values
+        even = symbols.size & ~1
+        pairs = symbols[:even].view('<u2')
+        codes, lengths = np.take(pair_codes, pairs), np.take(pair_lengths, pairs)
+        if even < symbols.size:
+            codes = np.append(codes, lut_codes[symbols[-1]])
+            lengths = np.append(lengths, lut_lengths[symbols[-1]])
+    else:
+        codes, lengths = np.take(lut_codes, symbols), np.take(lut_lengths, symbols)
+    if lengths.min() == 0:
+        raise KeyError("Symbol not found in the Huffman code table.")
+    return pack_codes(codes, lengths)
+
+
+def pack_codes(codes, lengths):
+    # writes each code with its own bit length, most significant bit first,
+    # into one packed byte string; lengths must be at most 64
+    codes = np.asarray(codes, dtype=np.uint64)
+    lengths = np.asarray(lengths, dtype=np.uint8)
+    if codes.size == 0:
+        return b'', 0
+
+    # glue neighbouring codes into longer words while they still fit in 64
+    # bits, so the scatter below handles a fraction of the original count
+    merges = 0
+    while codes.size >> merges > 1 and int(lengths.max()) << (merges + 1) <= 64:
+        merges += 1
+    if merges:
+        padding = -codes.size % (1 << merges)
+        if padding:
+            codes = np.concatenate((codes, np.zeros(padding, dtype=np.uint64)))
+            lengths = np.concatenate((lengths, np.zeros(padding, dtype=np.uint8)))
+        for _ in range(merges):
+            codes = (codes[0::2] << lengths[1::2]) | codes[1::2]
+            lengths = lengths[0::2] + lengths[1::2]
+
+    ends = np.cumsum(lengths, dtype=np.uint64)  # bit offset where each word ends
+    total_bits = int(ends[-1])
+    out = np.zeros(total_bits // 64 + 2, dtype=np.uint64)
+
+    for start in range(0, codes.size, PACK_CHUNK):
+        stop = start + PACK_CHUNK
+        chunk_lengths = lengths[start:stop]
+        offsets = ends[start:stop] - chunk_lengths
+        word = offsets >> 6
+        bit = offsets & 63
+        # left-align each code in 64 bits, then split it between the output
+        # word it starts in and the bits that spill into the next one
+        aligned = codes[start:stop] << (64 - chunk_lengths)
+        # word never decreases, so codes sharing an output word are adjacent
+        # and only the last code of each output word can spill over
+        lasts = np.append(np.flatnonzero(word[1:] != word[:-1]), word.size - 1)
+        firsts = np.append(0, lasts[:-1] + 1)
+        targets = word[firsts]
+        out[targets] |= np.bitwise_or.reduceat(aligned >> bit, firsts)
+        out[targets + 1] |= aligned[lasts] << (64 - bit[lasts])
+
+    return out.astype('>u8').tobytes()[:(total_bits + 7) // 8], total_bits
+
+
+def unpack_codes(packed, lengths):
+    # reads back codes of known bit lengths written by pack_codes
+    lengths = np.asarray(lengths, dtype=np.int64)
+    values = np.zeros(lengths.size, dtype=np.uint64)
+    if lengths.size == 0:
+        return values
+    bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8)).astype(np.uint64)
+    offsets = np.cumsum(lengths) - lengths
+    for bit in range(int(lengths.max())):
+        active = lengths > bit
+        values[active] = (values[active] << np.uint64(1)) | bits[offsets[active] + bit]
+    return values
+
+
+def _check_symbols(symbols):
+    # the text codecs work on characters; trees over other keys (e.g. the
+    # level indices in lossy.py) only give code lengths
+    if not all(isinstance(symbol, str) for symbol in symbols):
+        raise TypeError("Huffman text coding needs str symbols.")
+
+
+def build_decode_table(code_table):
+    # for every max_length bit window: the code point of the symbol whose
+    # code the window starts with, and that code's length; returns
+    # (symbols, lengths, max_length), with max_length 0 when the codes are
+    # decoded by walking the tree instead (a single symbol, or codes longer
+    # than DECODE_TABLE_BITS)
+    _check_symbols(code_table)
+    max_length = max((length for _, length in code_table.values()), default=0)
+    if max_length > DECODE_TABLE_BITS or len(code_table) < 2:
+        return None, None, 0
+    symbols = np.zeros(1 << max_length, dtype='<u4')
+    lengths = np.zeros(1 << max_length, dtype=np.int64)
+    for char, (code, length) in code_table.items():
+        first = code << (max_length - length)
+        last = (code + 1) << (max_length - length)
+        symbols[first:last] = ord(char)
+        lengths[first:last] = length
+    return symbols, lengths, max_length
+
+
+def _windows(words, positions, max_length):
+    # the max_length bits starting at each bit position
+    return (words[positions >> 3] >> (32 - max_length - (positions & 7))) & ((1 << max_length) - 1)
+
+
+@instrument('huffman decoding (packed)')
+def decode_huffman_packed(packed, bit_length, tree, table=None):
+    # table driven: the max_length bits at every bit position map to the
+    # symbol whose code they start with and that code's length, so the walk
+    # along the bits takes one step per symbol instead of one per bit
+    # table can hold build_decode_table(generate_code_table(tree)) to skip
+    # rebuilding it
+    if tree is None or not bit_length:
+        return ''
+    if table is None:
+        table = build_decode_table(generate_code_table(tree))
+    table_symbols, table_lengths, max_length = table
+    if not max_length:
+        bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8))[:bit_length]
+        decoded = decode_huffman((bits + 48).tobytes().decode(), tree)
+        add_bytes(len(decoded))
+        return decoded
+
+    # the 32 bits starting at every byte, so any window is one shift away;
+    # the padding covers windows reaching past the last byte
+    data = np.frombuffer(bytes(packed) + bytes(8), dtype=np.uint8).astype(np.uint32)
+    words = (data[:-3] << 24) | (data[1:-2] << 16) | (data[2:-1] << 8) | data[3:]
+
+    starts = []
+    pos = 0
+    for chunk in range(0, bit_length, DECODE_CHUNK):
+        stop = min(chunk + DECODE_CHUNK, bit_length)
+        lengths = table_lengths[_windows(words, np.arange(chunk, stop), max_length)].tolist()
+        while pos < stop:
+            starts.append(pos)
+            pos += lengths[pos - chunk]
+    if pos > bit_length:  # drops a code cut off by the end of the bits
+        starts.pop()
+    starts = np.array(starts, dtype=np.int64)
+
+    decoded = table_symbols[_windows(words, starts, max_length)]
+    decoded = decoded.tobytes().decode('utf-32-le')
+    add_bytes(len(decoded))
+    return decoded
+
+
+@instrument('huffman decoding')
+def decode_huffman(encoded_text, tree):
     decoded_text = []
-    current_node = root
+    chars, lo, hi, root = tree.chars, tree.lo, tree.hi, tree.root
+    if lo[root] < 0:  # single character tree, every bit is that character
+        _check_symbols(chars[root:root + 1])
+        add_bytes(len(encoded_text))
+        return chars[root] * len(encoded_text)
 
+    current_node = root
     for bit in encoded_text:
         if bit == '0':
-            current_node = current_node.lo
+            current_node = lo[current_node]
         else:
-            current_node = current_node.hi
+            current_node = hi[current_node]
 
-        if current_node.char is not None:
-            decoded_text.append(current_node.char)
+        if lo[current_node] < 0:
+            decoded_text.append(chars[current_node])
             current_node = root  # Reset to the root for the next character
 
+    add_bytes(len(decoded_text))
     return ''.join(decoded_text)
+
+
+if __name__ == '__main__':
+    # python huffman.py FILE [repeat]: packed encoding and decoding throughput
+    # on the file's bytes, repeated to make the timings measurable
+    import sys
+    import time
+
+    with open(sys.argv[1], 'rb') as f:
+        data = f.read() * (int(sys.argv[2]) if len(sys.argv) > 2 else 1)
+    text = data.decode('latin-1')
+    tree = build_huffman_tree(Counter(text))
+    code_table = generate_code_table(tree)
+    lookup = build_code_lookup(code_table)
+    started = time.perf_counter()
+    packed, bit_length = encode_text_packed(data, code_table, lookup)
+    encode_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    assert decode_huffman_packed(packed, bit_length, tree) == text
+    decode_seconds = time.perf_counter() - started
+    print(f"{len(data)} -> {len(packed)} bytes")
+    print(f"encoding: {encode_seconds * 1000:.1f} ms, {len(data) / encode_seconds / 1e6:.1f} MB/s")
+    print(f"decoding: {decode_seconds * 1000:.1f} ms, {len(data) / decode_seconds / 1e6:.1f} MB/s")
@@ -1,47 +1,304 @@
+from multiprocessing import shared_memory
+
 import numpy as np
 
+from huffman import build_huffman_tree, generate_code_table
+from profiling import add_bytes, add_iterations, instrument
+
+CHUNK = 1 << 20  # samples handled per pass, bounds temporary memory
+MAX_ITERATIONS = 1000  # Lloyd-Max iterations per level count
+KMEANS_SAMPLE = 100000  # samples considered when seeding k-means++
+EPSILON = 1e-6  # distance between levels started from the same value
+
+
+def load_signal(path, dtype=np.float32):
+    # maps the samples of a .npy file or a raw binary file without reading
+    # them into memory
+    if str(path).endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    return np.memmap(path, dtype=dtype, mode='r')
+
+
+def share_array(array):
+    # copies the array into a new shared memory block other processes can
+    # attach to by name; the caller closes and unlinks the block
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[...] = array
+    return shm, shared
+
+
+def attach_shared_array(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def index_dtype(num_levels):
+    return np.uint8 if num_levels <= 256 else np.uint16
+
+
+def _boundaries(levels):
+    # decision boundaries halfway between neighbouring (sorted) levels
+    return (levels[1:] + levels[:-1]) / 2
+
+
+class _SortedSamples:  # the samples sorted once, with prefix sums of x and x**2
+    def __init__(self, data):
+        # float64 like the levels, so searchsorted never converts the array;
+        # the values are centred on their mean, which keeps the prefix sums
+        # small next to a DC offset, and the levels are trained centred too
+        self.values = np.sort(np.asarray(data, dtype=np.float64).reshape(-1))
+        if self.values.size == 0:
+            raise ValueError("No samples to train on.")
+        self.offset = float(self.values.mean())
+        self.values -= self.offset
+        self.prefix = np.concatenate(([0.0], np.cumsum(self.values)))
+        self.prefix_sq = np.concatenate(([0.0], np.cumsum(np.square(self.values))))
+
+    @property
+    def size(self):
+        return self.values.size
+
+    def edges(self, levels):
+        # cluster i holds values[edges[i]:edges[i + 1]], samples on a boundary
+        # going to the lower level like nu_scalar_quantize does
+        inner = np.searchsorted(self.values, _boundaries(levels), side='right')
+        return np.concatenate(([0], inner, [self.size]))
+
+    def stats(self, edges, levels=None):
+        # count, mean and (for the given levels) squared error of each cluster;
+        # the errors come from the prefix sums, good enough to compare clusters
+        counts = np.diff(edges)
+        sums = self.prefix[edges[1:]] - self.prefix[edges[:-1]]
+        means = sums / np.maximum(counts, 1)
+        if levels is None:
+            levels = means
+        squared = self.prefix_sq[edges[1:]] - self.prefix_sq[edges[:-1]]
+        errors = np.maximum(squared - 2 * levels * sums + counts * np.square(levels), 0.0)
+        return counts, means, errors
+
+    def mean(self, start, stop):
+        return (self.prefix[stop] - self.prefix[start]) / (stop - start)
+
+    def mse(self, levels):
+        # the mean squared error summed sample by sample, for the reported
+        # distortion, where the prefix sums lose digits to cancellation
+        boundaries = _boundaries(levels)
+        total = 0.0
+        for start in range(0, self.size, CHUNK):
+            chunk = self.values[start:start + CHUNK]
+            total += np.square(chunk - levels[np.searchsorted(boundaries, chunk)]).sum()
+        return total / self.size
+
+
+def _split(samples, start, stop, level, epsilon):
+    # the means of the lower and upper half of a cluster, so both children
+    # start inside the data instead of a hair apart
+    if stop - start < 2 or samples.values[start] == samples.values[stop - 1]:
+        return level - epsilon, level + epsilon
+    middle = (start + stop) // 2
+    return samples.mean(start, middle), samples.mean(middle, stop)
 
-def lbg_algorithm(data, num_levels):
-    data = np.array(data)
-    epsilon = 1e-6  # Small value to prevent infinite loop
 
+def _reseed(samples, levels):
+    # moves empty levels into the cluster with the largest squared error,
+    # splitting it at its median, one level at a time
+    for _ in range(levels.size):
+        edges = samples.edges(levels)
+        counts, _, errors = samples.stats(edges, levels)
+        empty = np.flatnonzero(counts == 0)
+        first = samples.values[np.minimum(edges[:-1], samples.size - 1)]
+        last = samples.values[np.maximum(edges[1:] - 1, 0)]
+        splittable = (counts >= 2) & (first != last)
+        if not empty.size or not splittable.any():
+            break  # nothing empty, or fewer distinct values than levels
+        worst = np.flatnonzero(splittable)[np.argmax(errors[splittable])]
+        levels = levels.copy()
+        levels[worst], levels[empty[0]] = _split(
+            samples, edges[worst], edges[worst + 1], levels[worst], 0.0)
+        levels.sort()
+    return levels
+
+
+def _lloyd_max(samples, levels):
+    # alternates optimal boundaries (midpoints) and optimal levels (cluster
+    # means) until the partition stops changing; returns levels, iterations
+    # and the mean squared error
+    levels = np.sort(levels)
+    edges = None
+    iterations = 0
+    while iterations < MAX_ITERATIONS:
+        iterations += 1
+        add_iterations()
+        new_edges = samples.edges(levels)
+        if edges is not None and np.array_equal(new_edges, edges):
+            break
+        edges = new_edges
+        counts, means, _ = samples.stats(edges)
+        empty = counts == 0
+        levels = np.sort(np.where(empty, levels, means))
+        if empty.any():
+            # an empty level can sit on the mean of a neighbouring cluster
+            levels = _reseed(samples, _separate(levels))
+    return levels, iterations, samples.mse(levels)
+
+
+def _separate(levels):
+    # levels starting on the same value move EPSILON steps apart around it
+    # (+1, -1, +2, ...), like split levels, so each gets its own cluster;
+    # levels less than EPSILON / 2 apart count as the same value, since they
+    # can merge once the mean is added back, and a moved level can land on a
+    # neighbour, so this repeats until none do
+    levels = np.sort(levels)
+    index = np.arange(levels.size)
+    for _ in range(levels.size):
+        new_value = ~(np.diff(levels, prepend=-np.inf) < EPSILON / 2)
+        if new_value.all():
+            break
+        repeat = index - np.maximum.accumulate(np.where(new_value, index, 0))
+        levels = np.sort(levels + EPSILON * np.where(repeat % 2, (repeat + 1) // 2, -(repeat // 2)))
+    return levels
+
+
+def _initial_levels(samples, num_levels, init, seed):
+    if init == 'quantile':
+        # the means of num_levels groups holding equally many samples
+        edges = np.linspace(0, samples.size, num_levels + 1).astype(np.int64)
+        counts, means, _ = samples.stats(edges)
+        # with fewer samples than levels some groups are empty; they start on
+        # a sample and get reseeded
+        return _separate(np.where(counts > 0, means,
+                                  samples.values[np.minimum(edges[:-1], samples.size - 1)]))
+    if init == 'kmeans++':
+        # D^2 sampling on at most KMEANS_SAMPLE evenly spread samples
+        rng = np.random.default_rng(seed)
+        step = max(1, samples.size // KMEANS_SAMPLE)
+        candidates = samples.values[::step]
+        levels = [candidates[rng.integers(candidates.size)]]
+        distances = np.square(candidates - levels[0])
+        for _ in range(num_levels - 1):
+            total = distances.sum()
+            if total == 0:
+                levels.append(levels[-1])  # separated below, reseeded later
+                continue
+            levels.append(candidates[rng.choice(candidates.size, p=distances / total)])
+            distances = np.minimum(distances, np.square(candidates - levels[-1]))
+        return _separate(np.array(levels))
+    raise ValueError(f"Unknown initialization '{init}'.")
+
+
+def _lbg_splits(samples, num_levels):
+    # yields (levels, iterations, mse) after every split, i.e. at 2, 4, 8, ...
+    # levels, so one training run serves every power-of-two level count
     # Initialize the first quantization level as the mean of the data
-    levels = [np.mean(data)]
+    levels = np.array([samples.mean(0, samples.size)])
 
     # Iteratively split levels until the desired number is reached
-    while len(levels) < num_levels:
-        # Split each level into two by adding/subtracting a small value
-        levels = [level + epsilon for level in levels] + \
-            [level - epsilon for level in levels]
+    while levels.size < num_levels:
+        # Split each level into the means of the two halves of its cluster;
+        # children of neighbouring levels a hair apart can coincide
+        edges = samples.edges(levels)
+        levels = _separate(np.array([child for i, level in enumerate(levels)
+                                     for child in _split(samples, edges[i], edges[i + 1], level, EPSILON)]))
+        levels, iterations, mse = _lloyd_max(samples, levels)
+        yield levels, iterations, mse
+
+
+@instrument('LBG training')
+def lbg_train(data, num_levels, init='split', seed=0):
+    # init: 'split' doubles the levels like LBG (num_levels is rounded up to a
+    # power of two), 'quantile' and 'kmeans++' start from num_levels levels
+    add_bytes(np.asarray(data).nbytes)
+    samples = _SortedSamples(data)
+    levels = np.array([samples.mean(0, samples.size)])
+    iterations, mse = 0, samples.mse(levels)
+    if init == 'split':
+        for levels, split_iterations, mse in _lbg_splits(samples, num_levels):
+            iterations += split_iterations
+    elif num_levels > 1:
+        levels, iterations, mse = _lloyd_max(
+            samples, _initial_levels(samples, num_levels, init, seed))
+    levels = levels + samples.offset
+    return {'levels': levels, 'boundaries': _boundaries(levels),
+            'iterations': iterations, 'mse': float(mse)}
 
-        while True:
-            # Assign data points to the nearest quantization level
-            clusters = {level: [] for level in levels}
-            for point in data:
-                nearest_level = min(levels, key=lambda x: abs(point - x))
-                clusters[nearest_level].append(point)
 
-            # Update levels to the mean of each cluster
-            new_levels = [
-                np.mean(clusters[level]) if clusters[level] else level for level in levels]
+def lbg_algorithm(data, num_levels, init='split'):
+    trained = lbg_train(data, num_levels, init)
+    return trained['levels'], trained['boundaries']
 
-            # Check for convergence
-            if np.allclose(new_levels, levels, atol=epsilon):
-                break
 
-            levels = new_levels
+def _huffman_bits(counts):
+    # average Huffman code length of the level indices
+    frequency = {index: int(count) for index, count in enumerate(counts) if count}
+    code_table = generate_code_table(build_huffman_tree(frequency))
+    return sum(frequency[index] * length
+               for index, (_, length) in code_table.items()) / sum(frequency.values())
 
-    # Determine decision boundaries
-    boundaries = []
-    for i in range(len(levels) - 1):
-        boundaries.append((levels[i] + levels[i + 1]) / 2)
 
-    return levels, boundaries
+@instrument('LBG rate-distortion')
+def rate_distortion_curve(data, max_levels, entropy_coded=False):
+    # trains once up to max_levels and reports, for every power-of-two level
+    # count, the codebook with its rate (bits/sample) and distortion
+    add_bytes(np.asarray(data).nbytes)
+    samples = _SortedSamples(data)
+    power = samples.prefix_sq[-1] / samples.size + samples.offset ** 2
+    curve = []
+    for levels, iterations, mse in _lbg_splits(samples, max_levels):
+        point = {
+            'levels': levels.size,
+            'codebook': levels + samples.offset,
+            'bits_per_sample': float(np.log2(levels.size)),
+            'iterations': iterations,
+            'mse': float(mse),
+            'snr_db': float(10 * np.log10(power / mse)) if mse > 0 else float('inf'),
+        }
+        if entropy_coded:
+            counts, _, _ = samples.stats(samples.edges(levels))
+            point['huffman_bits_per_sample'] = _huffman_bits(counts)
+        curve.append(point)
+    return curve
 
 
+def format_rate_distortion(curve):
+    lines = []
+    for point in curve:
+        line = (f"{point['levels']} levels: {point['bits_per_sample']:.0f} bits/sample, "
+                f"MSE {point['mse']:.6g}, SNR {point['snr_db']:.2f} dB, "
+                f"{point['iterations']} iteration(s)")
+        if 'huffman_bits_per_sample' in point:
+            line += f", Huffman {point['huffman_bits_per_sample']:.3f} bits/sample"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def nu_scalar_quantize(data, levels, out=None):
+    # index of the level each sample falls to, as uint8 or uint16; out can be
+    # a preallocated (e.g. shared memory) array of the same shape
+    data = np.asarray(data)
+    boundaries = _boundaries(np.asarray(levels))
+    if out is None:
+        out = np.empty(data.shape, dtype=index_dtype(len(levels)))
+    elif out.shape != data.shape:
+        raise ValueError("out must have the shape of data.")
+    # reshape would copy a non-contiguous array, and the indices would never
+    # reach out; .flat reads and writes it in place, chunk by chunk
+    flat_data = data.reshape(-1) if data.flags.c_contiguous else data.flat
+    flat_out = out.reshape(-1) if out.flags.c_contiguous else out.flat
+    for start in range(0, data.size, CHUNK):
+        flat_out[start:start + CHUNK] = np.searchsorted(
+            boundaries, flat_data[start:start + CHUNK])
+    return out
+
+
+def nu_scalar_dequantize(indices, levels, out=None, dtype=np.float64):
+    return np.take(np.asarray(levels, dtype=dtype), indices, out=out)
+
+
+@instrument('LBG quantization')
 def lbg_compression(data, num_levels):
+    add_bytes(np.asarray(data).nbytes)
     levels, boundaries = lbg_algorithm(data, num_levels)
-    compressed_data = []
     ranges = []
 
     # Define ranges using boundaries and levels
@@ -51,25 +308,6 @@ def lbg_compression(data, num_levels):
     ranges.append(f"[{boundaries[-1]}, ∞)")  # Last group
 
     # Assign data points to quantized levels
-    for point in data:
-        for i, boundary in enumerate(boundaries):
-            if point <= boundary:
-                compressed_data.append(levels[i])
-                break
-        else:
-            compressed_data.append(levels[-1])
+    compressed_data = nu_scalar_dequantize(nu_scalar_quantize(data, levels), levels)
 
     return compressed_data, levels, ranges
-
-    levels, boundaries = lbg_algorithm(data, num_levels)
-    compressed_data = []
-
-    for point in data:
-        for i, boundary in enumerate(boundaries):
-            if point <= boundary:
-                compressed_data.append(levels[i])
-                break
-        else:
-            compressed_data.append(levels[-1])
-
-    return compressed_data, levels
@@ -0,0 +1,145 @@
+# LZSS: repeated substrings are replaced by (length, distance) references to
+# an earlier occurrence inside a sliding window, found through hash chains
+#
+# the output follows DEFLATE's literal/length alphabet: symbols 0-255 are
+# literal bytes and 256 + (length - MIN_MATCH) is a match of that length,
+# which is followed by its distance in a separate list
+import numpy as np
+
+from profiling import add_bytes, instrument
+
+MIN_MATCH = 3
+MAX_MATCH = 258
+MAX_WINDOW = 1 << 20
+
+# effort level -> (candidates searched per position, length that ends the
+# search early, lazy matching), in the spirit of zlib's configuration table
+LEVELS = {
+    1: (4, 8, False),
+    2: (8, 16, False),
+    3: (32, 32, False),
+    4: (16, 16, True),
+    5: (32, 32, True),
+    6: (128, 128, True),
+    7: (256, 128, True),
+    8: (1024, MAX_MATCH, True),
+    9: (4096, MAX_MATCH, True),
+}
+
+
+def _match_length(data, a, b, limit):
+    # length of the common prefix of data[a:] and data[b:], at most limit,
+    # using slice comparisons so the bytes are compared in C
+    if data[a:a + limit] == data[b:b + limit]:
+        return limit
+    lo, hi = 0, limit  # data[a:a + lo] matches, data[a:a + hi] does not
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if data[a:a + mid] == data[b:b + mid]:
+            lo = mid
+        else:
+            hi = mid
+    return lo
+
+
+class _MatchFinder:
+    def __init__(self, data, window_size, max_chain, nice_length):
+        self.data = data
+        self.window_size = window_size
+        self.max_chain = max_chain
+        self.nice_length = nice_length
+        # hash of the 3 bytes starting at every position
+        codes = np.frombuffer(data, dtype=np.uint8).astype(np.int64)
+        self.keys = ((codes[:-2] << 16) | (codes[1:-1] << 8) | codes[2:]).tolist()
+        self.head = {}  # key -> most recent position with that key
+        self.prev = [-1] * len(data)  # position -> previous one with its key
+        self.inserted = 0  # positions below this are in the chains
+
+    def insert_until(self, pos):
+        keys, head, prev = self.keys, self.head, self.prev
+        for i in range(self.inserted, min(pos, len(keys))):
+            prev[i] = head.get(keys[i], -1)
+            head[keys[i]] = i
+        self.inserted = max(self.inserted, pos)
+
+    def longest(self, pos):
+        # best (length, distance) for a match starting at pos
+        data = self.data
+        limit = min(MAX_MATCH, len(data) - pos)
+        if limit < MIN_MATCH:
+            return 0, 0
+        self.insert_until(pos)
+        best_length, best_distance = MIN_MATCH - 1, 0
+        candidate = self.head.get(self.keys[pos], -1)
+        chain = self.max_chain
+        lowest = pos - self.window_size
+        while candidate >= 0 and candidate >= lowest and chain:
+            # only a candidate that also matches one byte past the current best
+            # can beat it
+            if data[candidate + best_length] == data[pos + best_length]:
+                length = _match_length(data, candidate, pos, limit)
+                if length > best_length:
+                    best_length, best_distance = length, pos - candidate
+                    if length >= self.nice_length or length == limit:
+                        break
+            candidate = self.prev[candidate]
+            chain -= 1
+        if best_distance == 0:
+            return 0, 0
+        return best_length, best_distance
+
+
+@instrument('LZSS match finding')
+def lzss_tokens(data, window_size=32768, level=6):
+    # returns the literal/length symbols and the match distances
+    add_bytes(len(data))
+    if not 1 <= window_size <= MAX_WINDOW:
+        raise ValueError(f"Window size must be between 1 and {MAX_WINDOW}.")
+    if level not in LEVELS:
+        raise ValueError("Level must be between 1 and 9.")
+    max_chain, nice_length, lazy = LEVELS[level]
+    finder = _MatchFinder(bytes(data), window_size, max_chain, nice_length)
+
+    symbols, distances = [], []
+    pos = 0
+    pending = None  # match found at pos by the lazy lookahead
+    while pos < len(data):
+        length, distance = pending or finder.longest(pos)
+        pending = None
+        if lazy and MIN_MATCH <= length < nice_length:
+            # a longer match one byte later beats taking this one now
+            next_match = finder.longest(pos + 1)
+            if next_match[0] > length:
+                symbols.append(data[pos])
+                pos += 1
+                pending = next_match
+                continue
+        if length >= MIN_MATCH:
+            symbols.append(256 + length - MIN_MATCH)
+            distances.append(distance)
+            pos += length
+        else:
+            symbols.append(data[pos])
+            pos += 1
+    return symbols, distances
+
+
+@instrument('LZSS decoding')
+def lzss_decode(symbols, distances):
+    out = bytearray()
+    distances = iter(distances)
+    for symbol in symbols:
+        if symbol < 256:
+            out.append(symbol)
+            continue
+        length = symbol - 256 + MIN_MATCH
+        distance = next(distances)
+        start = len(out) - distance
+        if distance >= length:
+            out += out[start:start + length]
+        else:
+            # the match overlaps its own output, so it repeats the last bytes
+            pattern = out[start:]
+            out += (pattern * (length // distance + 1))[:length]
+    add_bytes(len(out))
+    return bytes(out)
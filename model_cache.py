@@ -0,0 +1,117 @@
+# pre-trained models for compressing many small messages with the same
+# distribution: train once on a sample, keep the model in an LRU cache and
+# put only the model id in each message header
+import struct
+import zlib
+from collections import Counter, OrderedDict
+
+from arithmetic_encoder import arithmetic_encode_packed, arithmetic_decode_packed, build_cumulative_counts
+from huffman import (build_huffman_tree, generate_code_table, build_code_lookup,
+                     build_decode_table, encode_text_packed, decode_huffman_packed)
+from varint import write_varint, read_varint
+
+
+def _sample_frequency(sample, alphabet):
+    # every character of the alphabet gets a count of at least one so that
+    # messages may use characters the sample never contained
+    frequency = Counter(sample)
+    for char in alphabet or ():
+        if char not in frequency:
+            frequency[char] = 1
+    return frequency
+
+
+def _model_id(kind, items):
+    # derived from the model contents, so encoder and decoder processes that
+    # train on the same sample agree on the id without talking to each other
+    return zlib.crc32(repr((kind, sorted(items))).encode())
+
+
+class HuffmanModel:  # a huffman tree, its codes and decode table, built once and reused
+    __slots__ = ('model_id', 'tree', 'code_table', 'lookup', 'decode_table')
+
+    def __init__(self, frequency):
+        self.tree = build_huffman_tree(frequency)
+        self.code_table = generate_code_table(self.tree)
+        self.lookup = build_code_lookup(self.code_table)
+        self.decode_table = build_decode_table(self.code_table)
+        self.model_id = _model_id('huffman', self.code_table.items())
+
+    def same_as(self, other):
+        return isinstance(other, HuffmanModel) and other.code_table == self.code_table
+
+    def encode(self, text):
+        packed, _ = encode_text_packed(text, self.code_table, self.lookup)
+        return packed
+
+    def decode(self, packed, length):
+        decoded = decode_huffman_packed(packed, len(packed) * 8, self.tree, self.decode_table)
+        return decoded[:length]  # drops symbols decoded from the padding bits
+
+
+class ArithmeticModel:  # integer cumulative counts, built once
+    __slots__ = ('model_id', 'cumulative_counts')
+
+    def __init__(self, frequency):
+        self.cumulative_counts = build_cumulative_counts(
+            {char: frequency[char] for char in sorted(frequency)})
+        self.model_id = _model_id('arithmetic', self.cumulative_counts.items())
+
+    def same_as(self, other):
+        return (isinstance(other, ArithmeticModel)
+                and other.cumulative_counts == self.cumulative_counts)
+
+    def encode(self, text):
+        packed, _ = arithmetic_encode_packed(text, self.cumulative_counts)
+        return packed
+
+    def decode(self, packed, length):
+        return arithmetic_decode_packed(packed, self.cumulative_counts, length)
+
+
+def train_huffman_model(sample, alphabet=None):
+    return HuffmanModel(_sample_frequency(sample, alphabet))
+
+
+def train_arithmetic_model(sample, alphabet=None):
+    return ArithmeticModel(_sample_frequency(sample, alphabet))
+
+
+class ModelCache:  # keeps the most recently used models, keyed by model id
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.models = OrderedDict()
+
+    def add(self, model):
+        # the ids are 32 bit checksums, so two different models can share one;
+        # replacing the cached model would make its messages decode wrongly
+        held = self.models.get(model.model_id)
+        if held is not None and not held.same_as(model):
+            raise ValueError(f"Model id {model.model_id} is already used by a different model.")
+        self.models[model.model_id] = model
+        self.models.move_to_end(model.model_id)
+        if len(self.models) > self.capacity:
+            self.models.popitem(last=False)  # evicts the least recently used
+        return model.model_id
+
+    def get(self, model_id):
+        if model_id not in self.models:
+            raise KeyError(f"Model {model_id} is not in the cache.")
+        self.models.move_to_end(model_id)
+        return self.models[model_id]
+
+    def __contains__(self, model_id):
+        return model_id in self.models
+
+    def __len__(self):
+        return len(self.models)
+
+    def encode(self, model_id, text):
+        # header: 4 byte model id, then the message length as a varint
+        payload = self.get(model_id).encode(text)
+        return struct.pack('>I', model_id) + write_varint(len(text)) + payload
+
+    def decode(self, message):
+        model_id, = struct.unpack_from('>I', message)
+        length, pos = read_varint(message, 4)
+        return self.get(model_id).decode(message[pos:], length)
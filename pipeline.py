@@ -0,0 +1,393 @@
+# composable compression pipelines: data is cut into blocks and each block
+# goes through a list of stages, e.g. BWT -> MTF -> RLE -> Huffman
+#
+# stages pass text (str) to each other and the last stage produces bytes;
+# encode returns (output, header) where the header holds whatever the stage
+# needs to undo itself, and decode(output, header) reverses it
+import sys
+import time
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from arithmetic_encoder import arithmetic_decode_packed, arithmetic_encode_packed, build_cumulative_counts
+from bwt import bwt_encode, bwt_decode, mtf_encode, mtf_decode
+from huffman import (build_huffman_tree, generate_code_table, encode_text_packed,
+                     decode_huffman_packed, pack_codes, unpack_codes)
+from lzss import lzss_tokens, lzss_decode
+from varint import write_varint, read_varint
+
+BLOCK_SIZE = 1 << 18  # bytes per block, bounds the memory of the BWT sort
+RLE_LIMIT = '\ud7ff'  # RLEStage shifts symbols up by one, below the surrogates
+STORED, CODED = b'\x00', b'\x01'  # block modes
+DISTANCE_BASE = 0x10000  # LZSS distances d are passed on as chr(DISTANCE_BASE + d - 1)
+
+
+def _codes(text):
+    return np.frombuffer(text.encode('utf-32-le'), dtype='<u4')
+
+
+def _text(codes):
+    return np.asarray(codes, dtype='<u4').tobytes().decode('utf-32-le')
+
+
+def _coded_size(block, header=b''):
+    # bytes the pipeline would output if the stages after this one were an
+    # order-0 entropy coder: the entropy of the symbols plus the header, the
+    # coder's own table left out; bytes from the last stage count as they are
+    if isinstance(block, bytes):
+        return len(block) + len(header)
+    counts = np.unique(_codes(block), return_counts=True)[1]
+    bits = float((counts * np.log2(counts.sum() / counts)).sum())
+    return int(np.ceil(bits / 8)) + len(header)
+
+
+def _write_frequency(frequency):
+    out = bytearray(write_varint(len(frequency)))
+    for char, count in sorted(frequency.items()):
+        out += write_varint(ord(char)) + write_varint(count)
+    return bytes(out)
+
+
+def _read_frequency(data, pos):
+    size, pos = read_varint(data, pos)
+    frequency = {}
+    for _ in range(size):
+        char, pos = read_varint(data, pos)
+        frequency[chr(char)], pos = read_varint(data, pos)
+    return frequency, pos
+
+
+class BWTStage:
+    name = 'BWT'
+    emits_bytes = False
+
+    def encode(self, block):
+        last_column, primary = bwt_encode(_codes(block))
+        return _text(last_column), write_varint(primary)
+
+    def decode(self, block, header):
+        primary, _ = read_varint(header, 0)
+        return _text(bwt_decode(_codes(block), primary))
+
+
+class MTFStage:
+    name = 'MTF'
+    emits_bytes = False
+
+    def encode(self, block):
+        alphabet = ''.join(sorted(set(block)))
+        ranks = mtf_encode(block, alphabet)
+        return ''.join(map(chr, ranks)), alphabet.encode('utf-8')
+
+    def decode(self, block, header):
+        return ''.join(mtf_decode(map(ord, block), header.decode('utf-8')))
+
+
+class RLEStage:
+    # bzip2-style zero runs for MTF output: a run of n zeros becomes n in
+    # bijective base 2, least significant digit first, with RUNA (0) worth 1
+    # and RUNB (1) worth 2 at each place; other symbols move up by one, so
+    # single symbols cost nothing extra and long runs shrink to log n symbols
+    name = 'RLE'
+    emits_bytes = False
+
+    @staticmethod
+    def _run(length):
+        digits = []
+        while length:
+            digit = 2 - length % 2
+            digits.append(chr(digit - 1))
+            length = (length - digit) // 2
+        return digits
+
+    def encode(self, block):
+        out = []
+        run = 0
+        for symbol in block:
+            if symbol == '\0':
+                run += 1
+                continue
+            if run:
+                out += self._run(run)
+                run = 0
+            if symbol >= RLE_LIMIT:
+                raise ValueError("Symbol too large for the RLE stage.")
+            out.append(chr(ord(symbol) + 1))
+        out += self._run(run)
+        return ''.join(out), b''
+
+    def decode(self, block, header):
+        out = []
+        run, place = 0, 1
+        for symbol in block:
+            code = ord(symbol)
+            if code < 2:
+                run += (code + 1) * place
+                place *= 2
+                continue
+            if run:
+                out.append('\0' * run)
+                run, place = 0, 1
+            out.append(chr(code - 1))
+        out.append('\0' * run)
+        return ''.join(out)
+
+
+class HuffmanStage:
+    name = 'Huffman'
+    emits_bytes = True
+
+    def encode(self, block):
+        frequency = Counter(block)
+        header = _write_frequency(frequency) + write_varint(len(block))
+        if not block:
+            return b'', header
+        packed, _ = encode_text_packed(block, generate_code_table(build_huffman_tree(frequency)))
+        return packed, header
+
+    def decode(self, block, header):
+        frequency, pos = _read_frequency(header, 0)
+        length, _ = read_varint(header, pos)
+        if not length:
+            return ''
+        tree = build_huffman_tree(frequency)
+        return decode_huffman_packed(block, len(block) * 8, tree)[:length]
+
+
+class ArithmeticStage:
+    # finite precision integer arithmetic coding with the block's own symbol
+    # counts, which go in the header like HuffmanStage's
+    name = 'Arithmetic'
+    emits_bytes = True
+
+    @staticmethod
+    def _model(frequency):
+        return build_cumulative_counts(dict(sorted(frequency.items())))
+
+    def encode(self, block):
+        frequency = Counter(block)
+        header = _write_frequency(frequency) + write_varint(len(block))
+        if len(frequency) < 2:  # nothing to code, the header says it all
+            return b'', header
+        packed, _ = arithmetic_encode_packed(block, self._model(frequency))
+        return packed, header
+
+    def decode(self, block, header):
+        frequency, pos = _read_frequency(header, 0)
+        length, _ = read_varint(header, pos)
+        if len(frequency) < 2:
+            return ''.join(frequency) * length
+        return arithmetic_decode_packed(bytes(block), self._model(frequency), length)
+
+
+class LZSSStage:
+    # literal/length symbols stay below 512, each match is followed by its
+    # distance above DISTANCE_BASE
+    name = 'LZSS'
+    emits_bytes = False
+
+    def __init__(self, window_size=32768, level=6):
+        self.window_size = window_size
+        self.level = level
+
+    def encode(self, block):
+        symbols, distances = lzss_tokens(block.encode('latin-1'), self.window_size, self.level)
+        symbols = np.array(symbols, dtype=np.int64)
+        is_match = symbols >= 256
+        tokens = np.empty(symbols.size + len(distances), dtype=np.int64)
+        # every symbol moves right by the number of distances before it
+        at = np.arange(symbols.size) + np.cumsum(is_match) - is_match
+        tokens[at] = symbols
+        tokens[at[is_match] + 1] = np.array(distances, dtype=np.int64) + DISTANCE_BASE - 1
+        return _text(tokens), b''
+
+    def decode(self, block, header):
+        tokens = _codes(block).astype(np.int64)
+        is_distance = tokens >= DISTANCE_BASE
+        return lzss_decode(tokens[~is_distance].tolist(),
+                           (tokens[is_distance] - DISTANCE_BASE + 1).tolist()).decode('latin-1')
+
+
+class LZSSHuffmanStage:
+    # DEFLATE-like entropy coding of LZSSStage output: one Huffman table for
+    # literals/lengths, one for distance codes, and the low distance bits
+    # written raw, where distance - 1 has (code - 1) bits after its top bit
+    name = 'Huffman'
+    emits_bytes = True
+
+    @staticmethod
+    def _frame(parts):
+        return b''.join(write_varint(len(part)) + part for part in parts)
+
+    def encode(self, block):
+        tokens = _codes(block).astype(np.int64)
+        is_distance = tokens >= DISTANCE_BASE
+        offsets = tokens[is_distance] - DISTANCE_BASE
+        codes = np.zeros(offsets.size, dtype=np.int64)
+        nonzero = offsets > 0
+        codes[nonzero] = np.floor(np.log2(offsets[nonzero])).astype(np.int64) + 1
+        extra_bits = np.maximum(codes - 1, 0)
+        extras = np.where(codes > 0, offsets - (1 << extra_bits), 0)
+
+        huffman = HuffmanStage()
+        symbols, symbols_header = huffman.encode(_text(tokens[~is_distance]))
+        distances, distances_header = huffman.encode(_text(codes))
+        packed_extras, _ = pack_codes(extras, extra_bits)
+        return self._frame([symbols_header, symbols, distances_header, distances,
+                            packed_extras]), b''
+
+    def decode(self, block, header):
+        parts = []
+        pos = 0
+        while pos < len(block):
+            size, pos = read_varint(block, pos)
+            parts.append(block[pos:pos + size])
+            pos += size
+        symbols_header, symbols, distances_header, distances, packed_extras = parts
+
+        huffman = HuffmanStage()
+        symbols = _codes(huffman.decode(symbols, symbols_header)).astype(np.int64)
+        codes = _codes(huffman.decode(distances, distances_header)).astype(np.int64)
+        extra_bits = np.maximum(codes - 1, 0)
+        extras = unpack_codes(packed_extras, extra_bits).astype(np.int64)
+        offsets = np.where(codes > 0, (1 << extra_bits) + extras, 0)
+
+        is_match = symbols >= 256
+        tokens = np.empty(symbols.size + offsets.size, dtype=np.int64)
+        at = np.arange(symbols.size) + np.cumsum(is_match) - is_match
+        tokens[at] = symbols
+        tokens[at[is_match] + 1] = offsets + DISTANCE_BASE
+        return _text(tokens)
+
+
+class Pipeline:
+    def __init__(self, stages, block_size=BLOCK_SIZE):
+        self.stages = stages
+        self.block_size = block_size
+        self.reset_stats()
+
+    def reset_stats(self):
+        # per stage: encode and decode time, the sizes going in and out while
+        # encoding (symbols between stages, bytes at the ends), and the same
+        # as coded sizes, see _coded_size
+        self.stats = {stage.name: {'encode_seconds': 0.0, 'decode_seconds': 0.0,
+                                   'size_in': 0, 'size_out': 0,
+                                   'coded_in': 0, 'coded_out': 0}
+                      for stage in self.stages}
+
+    def _run(self, stage, method, block, *args):
+        started = time.perf_counter()
+        result = getattr(stage, method)(block, *args)
+        stats = self.stats[stage.name]
+        stats[method + '_seconds'] += time.perf_counter() - started
+        if method == 'encode':
+            stats['size_in'] += len(block)
+            stats['size_out'] += len(result[0])
+            stats['coded_in'] += _coded_size(block)
+            stats['coded_out'] += _coded_size(*result)
+        return result
+
+    def compress(self, data):
+        # each block: STORED and the varint sized raw block, or CODED, per
+        # stage a varint sized header and the varint sized output of the last
+        # stage; blocks the stages do not shrink are stored, so the output is
+        # never more than a few bytes per block larger than the input
+        out = bytearray()
+        for start in range(0, len(data), self.block_size):
+            raw = data[start:start + self.block_size]
+            block = raw.decode('latin-1')
+            headers = []
+            for stage in self.stages:
+                block, header = self._run(stage, 'encode', block)
+                headers.append(header)
+            if isinstance(block, str):
+                block = block.encode('utf-8')
+            coded = bytearray(CODED)
+            for header in headers:
+                coded += write_varint(len(header)) + header
+            coded += write_varint(len(block)) + block
+            if len(coded) < len(raw) + len(STORED) + len(write_varint(len(raw))):
+                out += coded
+            else:
+                out += STORED + write_varint(len(raw)) + raw
+        return bytes(out)
+
+    def decompress(self, data):
+        out = bytearray()
+        pos = 0
+        while pos < len(data):
+            mode = data[pos:pos + 1]
+            pos += 1
+            if mode == STORED:
+                size, pos = read_varint(data, pos)
+                out += data[pos:pos + size]
+                pos += size
+                continue
+            headers = []
+            for _ in self.stages:
+                size, pos = read_varint(data, pos)
+                headers.append(data[pos:pos + size])
+                pos += size
+            size, pos = read_varint(data, pos)
+            block = data[pos:pos + size]
+            pos += size
+            if not self.stages[-1].emits_bytes:
+                block = block.decode('utf-8')
+            for stage, header in zip(reversed(self.stages), reversed(headers)):
+                block = self._run(stage, 'decode', block, header)
+            out += block.encode('latin-1')
+        return bytes(out)
+
+    def report(self):
+        lines = []
+        for stage in self.stages:
+            stats = self.stats[stage.name]
+            # what the stage does to the size of the final output, not to the
+            # number of symbols
+            ratio = stats['coded_in'] / stats['coded_out'] if stats['coded_out'] else 0.0
+            lines.append(f"{stage.name}: {stats['size_in']} -> {stats['size_out']}, "
+                         f"coded {stats['coded_in']} -> {stats['coded_out']} bytes "
+                         f"(x{ratio:.3f}), encode {stats['encode_seconds'] * 1000:.1f} ms, "
+                         f"decode {stats['decode_seconds'] * 1000:.1f} ms")
+        return '\n'.join(lines)
+
+
+def bwt_pipeline(entropy='huffman', block_size=BLOCK_SIZE):
+    # BWT -> MTF -> RLE -> Huffman or Arithmetic
+    coder = HuffmanStage() if entropy == 'huffman' else ArithmeticStage()
+    return Pipeline([BWTStage(), MTFStage(), RLEStage(), coder], block_size)
+
+
+def deflate_pipeline(window_size=32768, level=6, block_size=BLOCK_SIZE):
+    # LZSS -> Huffman, like DEFLATE
+    return Pipeline([LZSSStage(window_size, level), LZSSHuffmanStage()], block_size)
+
+
+def benchmark(name, pipeline, data):
+    started = time.perf_counter()
+    compressed = pipeline.compress(data)
+    elapsed = time.perf_counter() - started
+    if pipeline.decompress(compressed) != data:
+        raise SystemExit(f"{name} pipeline round trip failed")
+    print(f"{name}: {len(data)} -> {len(compressed)} bytes "
+          f"(x{len(data) / max(len(compressed), 1):.3f}) in {elapsed * 1000:.1f} ms")
+    print(pipeline.report())
+
+
+if __name__ == '__main__':
+    # python pipeline.py FILE [block_size]: per stage reports for the BWT
+    # pipelines and the LZSS pipeline, with zlib at the same levels as yardstick
+    with open(sys.argv[1], 'rb') as f:
+        data = f.read()
+    block_size = int(sys.argv[2]) if len(sys.argv) > 2 else BLOCK_SIZE
+    for entropy in ('huffman', 'arithmetic'):
+        benchmark(f"BWT {entropy}", bwt_pipeline(entropy, block_size), data)
+    for level in (1, 6, 9):
+        benchmark(f"LZSS level {level}", deflate_pipeline(level=level, block_size=block_size), data)
+        started = time.perf_counter()
+        compressed = zlib.compress(data, level)
+        elapsed = time.perf_counter() - started
+        print(f"zlib level {level}: {len(data)} -> {len(compressed)} bytes "
+              f"(x{len(data) / max(len(compressed), 1):.3f}) in {elapsed * 1000:.1f} ms")
@@ -0,0 +1,132 @@
+# opt-in timing of the codec phases; while disabled an instrumented function
+# costs one extra call and a flag check
+import functools
+import json
+import time
+import tracemalloc
+
+enabled = False
+track_allocations = False
+_stats = {}
+_stack = []  # the instrumented calls running, innermost last
+
+
+def enable(allocations=False):
+    # allocations=True also records peak traced memory per call, which is slow
+    global enabled, track_allocations
+    enabled = True
+    track_allocations = allocations
+    if allocations and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    global enabled, track_allocations
+    enabled = False
+    if track_allocations and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    track_allocations = False
+
+
+def reset():
+    _stats.clear()
+    _stack.clear()
+
+
+def _phase(phase):
+    if phase not in _stats:
+        _stats[phase] = {'calls': 0, 'seconds': 0.0, 'total_seconds': 0.0, 'bytes': 0,
+                         'iterations': 0, 'allocated_bytes': 0}
+    return _stats[phase]
+
+
+def add_iterations(count=1):
+    # for loops inside a phase, e.g. the LBG refinement passes; counted for
+    # the innermost instrumented call running
+    if enabled and _stack:
+        _phase(_stack[-1]['phase'])['iterations'] += count
+
+
+def add_bytes(count):
+    # the uncompressed size an instrumented call handles (its input when
+    # encoding, its output when decoding; characters for text, bytes for
+    # arrays), recorded by the function itself since only it knows what its
+    # arguments amount to; bytes / seconds is the phase's throughput
+    if enabled and _stack:
+        _phase(_stack[-1]['phase'])['bytes'] += count
+
+
+def _peak_since_reset():
+    # peak traced memory since the last reset, then starts a new measurement
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    return peak
+
+
+def instrument(phase):
+    # records calls, wall time and optionally the peak of traced memory for
+    # every call; calls nest, so 'seconds' and 'allocated_bytes' leave out the
+    # time and memory of instrumented calls made inside, 'total_seconds'
+    # includes them
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+
+            frame = {'phase': phase, 'child_seconds': 0.0, 'peak': 0}
+            if track_allocations:
+                if _stack:  # the caller's memory up to here
+                    _stack[-1]['peak'] = max(_stack[-1]['peak'], _peak_since_reset())
+                else:
+                    tracemalloc.reset_peak()
+                frame['base'] = tracemalloc.get_traced_memory()[0]
+            _stack.append(frame)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                _stack.pop()
+                stats = _phase(phase)
+                stats['calls'] += 1
+                stats['seconds'] += elapsed - frame['child_seconds']
+                # a phase calling itself counts its time once
+                if all(outer['phase'] != phase for outer in _stack):
+                    stats['total_seconds'] += elapsed
+                if _stack:
+                    _stack[-1]['child_seconds'] += elapsed
+                if 'base' in frame and tracemalloc.is_tracing():
+                    peak = max(frame['peak'], _peak_since_reset())
+                    stats['allocated_bytes'] += max(peak - frame['base'], 0)
+        return wrapper
+    return decorator
+
+
+def get_stats():
+    return {phase: dict(stats) for phase, stats in _stats.items()}
+
+
+def format_stats():
+    # one line per phase, slowest first, for the GUI stats pane
+    lines = []
+    for phase, stats in sorted(_stats.items(), key=lambda item: -item[1]['seconds']):
+        line = f"{phase}: {stats['seconds'] * 1000:.3f} ms over {stats['calls']} call(s)"
+        if stats['total_seconds'] - stats['seconds'] > 5e-7:
+            line += f" ({stats['total_seconds'] * 1000:.3f} ms with nested phases)"
+        if stats['bytes']:
+            line += f", {stats['bytes']} bytes in"
+        if stats['iterations']:
+            line += f", {stats['iterations']} iteration(s)"
+        if stats['allocated_bytes']:
+            line += f", {stats['allocated_bytes']} bytes allocated"
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def export_json(path=None):
+    data = json.dumps(get_stats(), indent=2)
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(data)
+    return data
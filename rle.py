@@ -1,4 +1,9 @@
+from profiling import add_bytes, instrument
+
+
+@instrument('RLE encoding')
 def RLE(input_string):
+    add_bytes(len(input_string))
     if not input_string:
         return ""
 
@@ -16,6 +21,7 @@ def RLE(input_string):
 
     encoded_string += str(count) + prev_char
     return encoded_string
+@instrument('RLE decoding')
 def RLE_decode(encoded_string):
     if not encoded_string:
         return ""
@@ -30,4 +36,5 @@ def RLE_decode(encoded_string):
             decoded_string += char * int(count)
             count = ""
 
+    add_bytes(len(decoded_string))
     return decoded_string
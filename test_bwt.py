@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from bwt import _radix_argsort, bwt_decode, bwt_encode, mtf_decode, mtf_encode
+
+rng = np.random.default_rng(0)
+
+
+def sorted_rotations(codes):
+    symbols = codes.tolist()
+    return sorted(symbols[i:] + symbols[:i] for i in range(len(symbols)))
+
+
+@pytest.mark.parametrize('alphabet', [1, 2, 3, 256])
+def test_matches_sorted_rotations(alphabet):
+    for size in range(1, 80):
+        codes = rng.integers(0, alphabet, size)
+        last_column, primary = bwt_encode(codes)
+        rotations = sorted_rotations(codes)
+        assert last_column.tolist() == [rotation[-1] for rotation in rotations]
+        assert rotations[primary] == codes.tolist()
+        assert np.array_equal(bwt_decode(last_column, primary), codes)
+
+
+@pytest.mark.parametrize('codes', [np.zeros(5000, dtype=np.int64),
+                                   np.tile(rng.integers(0, 5, 37), 300),
+                                   rng.integers(0, 1 << 20, 70000)],
+                         ids=['zeros', 'periodic', 'wide symbols'])
+def test_round_trip(codes):
+    assert np.array_equal(bwt_decode(*bwt_encode(codes)), codes)
+
+
+def test_radix_argsort_is_stable():
+    keys = rng.integers(0, 1 << 32, 100000) // (1 << 14) * (1 << 14)
+    assert np.array_equal(_radix_argsort(keys), np.argsort(keys, kind='stable'))
+
+
+def test_empty():
+    last_column, primary = bwt_encode(np.array([], dtype=np.int64))
+    assert last_column.size == 0 and primary == 0
+
+
+def test_mtf_round_trip():
+    text = 'bananaaa bandana'
+    alphabet = ''.join(sorted(set(text)))
+    ranks = mtf_encode(text, alphabet)
+    assert ranks[6:8] == [0, 0]
+    assert ''.join(mtf_decode(ranks, alphabet)) == text
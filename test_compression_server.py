@@ -0,0 +1,113 @@
+import asyncio
+import struct
+
+import pytest
+
+from compression_client import CompressionClient
+from compression_server import CODECS, CompressionServer
+from varint import write_varint
+
+PAYLOADS = [
+    b'',
+    b'a',
+    b'11',
+    b'hello 123 world',
+    bytes(range(256)),
+    bytes(range(256)) * 3 + bytes(300) + b'\xff' * 1000,
+    b'0' * 5000 + b'9',
+]
+
+
+@pytest.mark.parametrize('codec', sorted(CODECS))
+@pytest.mark.parametrize('payload', PAYLOADS, ids=range(len(PAYLOADS)))
+def test_codec_round_trip(codec, payload):
+    compress, decompress = CODECS[codec]
+    assert decompress(compress(payload)) == payload
+
+
+def test_rle_compresses_runs():
+    compress, _ = CODECS['rle']
+    assert len(compress(b'7' * 1000 + b'8' * 1000)) == 6
+
+
+def run_with_server(test, tmp_path, **options):
+    async def main():
+        server = CompressionServer(1, **options)
+        unix_path = str(tmp_path / 'compression.sock')
+        await server.start(unix_path=unix_path)
+        try:
+            await test(lambda: CompressionClient.connect(unix_path=unix_path), unix_path)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+def test_requests_over_the_socket(tmp_path):
+    async def test(connect, _):
+        client = await connect()
+        for codec in sorted(CODECS):
+            for payload in PAYLOADS:
+                compressed = await client.compress(codec, payload)
+                assert await client.decompress(codec, compressed) == payload
+        metrics = await client.metrics()
+        assert metrics['huffman:C']['requests'] == len(PAYLOADS)
+        await client.close()
+    run_with_server(test, tmp_path)
+
+
+def test_metrics_request_with_body_is_rejected(tmp_path):
+    async def test(_, unix_path):
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+        writer.write(struct.pack('>cBQ', b'M', 0, 3) + b'C\x03rle')
+        await writer.drain()
+        status, length = struct.unpack('>BQ', await reader.readexactly(9))
+        assert status == 1 and await reader.readexactly(length) == b'bad request'
+        writer.close()
+    run_with_server(test, tmp_path)
+
+
+def test_slow_upload_does_not_hold_a_job_slot(tmp_path):
+    async def test(connect, unix_path):
+        # a client that announces a body and never sends it
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+        writer.write(struct.pack('>cB', b'C', 3) + b'rle' + struct.pack('>Q', 1 << 20) + b'x')
+        await writer.drain()
+        client = await connect()
+        compressed = await asyncio.wait_for(client.compress('rle', b'aaab'), 10)
+        assert await client.decompress('rle', compressed) == b'aaab'
+        await client.close()
+        writer.close()
+    run_with_server(test, tmp_path, max_jobs=1)
+
+
+def test_buffered_bodies_are_bounded(tmp_path):
+    async def test(connect, unix_path):
+        # a slow upload holds 800 of the 1000 bytes the server may buffer
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+        writer.write(struct.pack('>cB', b'C', 3) + b'rle' + struct.pack('>Q', 800) + b'x' * 10)
+        await writer.drain()
+        await asyncio.sleep(0.1)
+        client = await connect()
+        request = asyncio.ensure_future(client.compress('rle', b'y' * 300))
+        await asyncio.sleep(0.3)
+        assert not request.done()  # waits for room instead of buffering
+        writer.write(b'x' * 790)
+        await writer.drain()
+        status, length = struct.unpack('>BQ', await reader.readexactly(9))
+        assert status == 0 and await reader.readexactly(length) == write_varint(800) + b'x'
+        compressed = await asyncio.wait_for(request, 10)
+        assert await client.decompress('rle', compressed) == b'y' * 300
+        await client.close()
+        writer.close()
+    run_with_server(test, tmp_path, max_buffered=1000)
+
+
+def test_body_larger_than_the_budget_is_rejected(tmp_path):
+    async def test(_, unix_path):
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+        writer.write(struct.pack('>cB', b'C', 3) + b'rle' + struct.pack('>Q', 1001))
+        await writer.drain()
+        status, length = struct.unpack('>BQ', await reader.readexactly(9))
+        assert status == 1 and await reader.readexactly(length) == b'bad request'
+        writer.close()
+    run_with_server(test, tmp_path, max_buffered=1000)
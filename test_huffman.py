@@ -0,0 +1,114 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import huffman
+from huffman import (build_code_lookup, build_frequency_dict, build_huffman_tree,
+                     decode_huffman, decode_huffman_packed, encode_text, encode_text_packed,
+                     generate_code_table, generate_huffman_codes, pack_codes, unpack_codes)
+
+rng = np.random.default_rng(0)
+TEXTS = {
+    'single': 'aaaa',
+    'pair': 'ab',
+    'short': 'hello world',
+    'all bytes': ''.join(chr(byte) for byte in range(256)) * 3,
+    'all bytes and runs': ''.join(chr(byte) for byte in range(256)) * 3 + '\0' * 300 + '\xff' * 1000,
+    'random bytes': bytes(rng.integers(0, 256, 50000, dtype=np.uint8)).decode('latin-1'),
+    'skewed': ''.join(rng.choice(list('ab'), 20001, p=[0.99, 0.01])),
+    'geometric': ''.join(chr(65 + c) for c in rng.geometric(0.3, 100001)),
+    'uniform 4 bit': ''.join(chr(65 + c) for c in rng.integers(0, 16, 30000)),
+    'beyond latin-1': ''.join(chr(0x400 + c) for c in rng.integers(0, 40, 5000)),
+    'long codes': ''.join(chr(32 + c % 3000) for c in rng.zipf(1.3, 20000)),
+}
+
+
+def reference_bits(text, tree):
+    return encode_text(text, generate_huffman_codes(tree))
+
+
+@pytest.mark.parametrize('name', TEXTS)
+def test_packed_matches_string_encoding(name):
+    text = TEXTS[name]
+    tree = build_huffman_tree(build_frequency_dict(text))
+    packed, bit_length = encode_text_packed(text, generate_code_table(tree))
+    bits = reference_bits(text, tree)
+    assert bit_length == len(bits)
+    assert packed == np.packbits(np.frombuffer(bits.encode(), dtype=np.uint8) - 48).tobytes()
+
+
+@pytest.mark.parametrize('name', TEXTS)
+def test_packed_round_trip(name):
+    text = TEXTS[name]
+    tree = build_huffman_tree(build_frequency_dict(text))
+    code_table = generate_code_table(tree)
+    packed, bit_length = encode_text_packed(text, code_table, build_code_lookup(code_table))
+    assert decode_huffman_packed(packed, bit_length, tree) == text
+    # the padding bits of the last byte never add symbols in front of the text
+    assert decode_huffman_packed(packed, len(packed) * 8, tree)[:len(text)] == text
+
+
+def test_bytes_and_str_give_the_same_bits():
+    data = bytes(rng.integers(0, 200, 10001, dtype=np.uint8))
+    text = data.decode('latin-1')
+    code_table = generate_code_table(build_huffman_tree(build_frequency_dict(text)))
+    assert encode_text_packed(data, code_table) == encode_text_packed(text, code_table)
+
+
+@pytest.mark.parametrize('chunk', [1000, 4096])
+def test_small_decoding_passes(monkeypatch, chunk):
+    # codes crossing from one pass into the next decode the same
+    monkeypatch.setattr(huffman, 'DECODE_CHUNK', chunk)
+    for name in ('random bytes', 'skewed', 'geometric', 'uniform 4 bit'):
+        text = TEXTS[name]
+        tree = build_huffman_tree(build_frequency_dict(text))
+        packed, bit_length = encode_text_packed(text, generate_code_table(tree))
+        assert decode_huffman_packed(packed, bit_length, tree) == text
+
+
+def test_unknown_symbol():
+    code_table = generate_code_table(build_huffman_tree(build_frequency_dict('abc')))
+    with pytest.raises(KeyError):
+        encode_text_packed('abd', code_table)
+    with pytest.raises(KeyError):
+        encode_text_packed('abЀ', code_table)
+
+
+def test_empty():
+    code_table = generate_code_table(build_huffman_tree(build_frequency_dict('abc')))
+    assert encode_text_packed('', code_table) == (b'', 0)
+
+
+def test_pack_codes_round_trip():
+    lengths = rng.integers(1, 65, 10000)
+    codes = rng.integers(0, 1 << 63, 10000, dtype=np.uint64) >> (64 - lengths).astype(np.uint64)
+    packed, total_bits = pack_codes(codes, lengths)
+    assert total_bits == lengths.sum()
+    assert len(packed) == (total_bits + 7) // 8
+    assert np.array_equal(unpack_codes(packed, lengths), codes)
+
+
+def test_codes_longer_than_64_bits():
+    # a unary code reaches 70 bits, more than a packed word holds
+    huffman_code = {chr(65 + i): '1' * i + '0' for i in range(70)}
+    text = ''.join(chr(65 + c) for c in rng.integers(0, 70, 500))
+    packed, bit_length = encode_text_packed(text, huffman_code)
+    bits = encode_text(text, huffman_code)
+    assert bit_length == len(bits)
+    assert packed == np.packbits(np.frombuffer(bits.encode(), dtype=np.uint8) - 48).tobytes()
+
+
+def test_symbols_must_be_str():
+    # trees over integer keys give code lengths (lossy.py), not text codecs
+    tree = build_huffman_tree(Counter(b'abracadabra'))
+    packed, bit_length = encode_text_packed('abracadabra', generate_code_table(
+        build_huffman_tree(Counter('abracadabra'))))
+    with pytest.raises(TypeError):
+        encode_text_packed(b'abracadabra', generate_code_table(tree))
+    with pytest.raises(TypeError):
+        decode_huffman_packed(packed, bit_length, tree)
+    with pytest.raises(TypeError):
+        decode_huffman('0000', build_huffman_tree(Counter(b'aaaa')))
+    with pytest.raises(TypeError):
+        encode_text_packed([1, 2], generate_code_table(tree))
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+from lossy import (attach_shared_array, lbg_compression, lbg_train, load_signal,
+                   nu_scalar_dequantize, nu_scalar_quantize, rate_distortion_curve, share_array)
+
+rng = np.random.default_rng(0)
+SIGNALS = {
+    'normal': rng.standard_normal(20000),
+    'dc offset': 1e4 + 1e-3 * rng.standard_normal(20000),
+    'two clusters': np.concatenate([rng.normal(-5, 0.1, 5000), rng.normal(3, 1, 15000)]),
+}
+
+
+def direct_mse(data, levels):
+    quantized = nu_scalar_dequantize(nu_scalar_quantize(data, levels), levels)
+    return np.mean(np.square(data - quantized))
+
+
+@pytest.mark.parametrize('init', ['split', 'quantile', 'kmeans++'])
+@pytest.mark.parametrize('name', SIGNALS)
+def test_mse_matches_direct(init, name):
+    data = SIGNALS[name]
+    trained = lbg_train(data, 8, init)
+    assert trained['mse'] == pytest.approx(direct_mse(data, trained['levels']), rel=1e-9)
+
+
+@pytest.mark.parametrize('name', SIGNALS)
+def test_rate_distortion_curve(name):
+    data = SIGNALS[name]
+    curve = rate_distortion_curve(data, 16)
+    assert [point['levels'] for point in curve] == [2, 4, 8, 16]
+    assert all(np.unique(point['codebook']).size == point['levels'] for point in curve)
+    for point in curve:
+        mse = direct_mse(data, point['codebook'])
+        assert point['mse'] == pytest.approx(mse, rel=1e-9)
+        assert point['snr_db'] == pytest.approx(10 * np.log10(np.mean(np.square(data)) / mse))
+    assert all(a['mse'] >= b['mse'] for a, b in zip(curve, curve[1:]))
+
+
+@pytest.mark.parametrize('num_levels', [4, 8, 16])
+@pytest.mark.parametrize('init', ['split', 'quantile', 'kmeans++'])
+@pytest.mark.parametrize('data', [[5.0], [1.0, 2.0], [3.0] * 10, [1, 1, 1, 1]])
+def test_fewer_values_than_levels(init, data, num_levels):
+    levels = lbg_train(data, num_levels, init)['levels']
+    assert levels.size == num_levels
+    assert np.unique(levels).size == levels.size
+    assert direct_mse(np.array(data), levels) == 0
+
+
+def test_quantize_round_trip():
+    data = SIGNALS['two clusters'].astype(np.float32)
+    compressed, levels, ranges = lbg_compression(data, 4)
+    assert len(ranges) == levels.size == 4
+    indices = nu_scalar_quantize(data, levels)
+    assert indices.dtype == np.uint8
+    assert np.array_equal(nu_scalar_dequantize(indices, levels), compressed)
+    assert np.array_equal(nu_scalar_quantize(compressed, levels), indices)
+
+
+def test_no_samples():
+    with pytest.raises(ValueError):
+        lbg_train([], 4)
+
+
+def test_rate_distortion_curve_on_a_constant():
+    for point in rate_distortion_curve(np.full(100, 7.0), 16):
+        assert np.unique(point['codebook']).size == point['levels']
+        assert point['mse'] == 0
+
+
+LEVELS = np.array([-1.0, 0.0, 0.5, 2.0])
+
+
+def test_out_arrays():
+    data = SIGNALS['normal'][:20].reshape(4, 5)
+    expected = nu_scalar_quantize(data, LEVELS)
+    for out in (np.zeros((4, 5), np.uint8), np.zeros((5, 4), np.uint8).T,
+                np.zeros((4, 10), np.uint8)[:, ::2]):
+        assert nu_scalar_quantize(data, LEVELS, out=out) is out
+        assert np.array_equal(out, expected)
+        values = np.zeros((5, 4)).T
+        assert np.array_equal(nu_scalar_dequantize(out, LEVELS, out=values), LEVELS[expected])
+        assert np.array_equal(values, LEVELS[expected])
+    # a non-contiguous input reads the same
+    assert np.array_equal(nu_scalar_quantize(data.T, LEVELS), expected.T)
+    with pytest.raises(ValueError):
+        nu_scalar_quantize(data, LEVELS, out=np.zeros(20, np.uint8))
+
+
+def test_npy_memmap_round_trip(tmp_path):
+    data = SIGNALS['two clusters']
+    np.save(tmp_path / 'signal.npy', data)
+    signal = load_signal(tmp_path / 'signal.npy')
+    assert isinstance(signal, np.memmap) and np.array_equal(signal, data)
+    # indices written straight into a memory mapped .npy file
+    out = np.lib.format.open_memmap(tmp_path / 'indices.npy', mode='w+',
+                                    dtype=np.uint8, shape=data.shape)
+    nu_scalar_quantize(signal, LEVELS, out=out)
+    out.flush()
+    del out
+    assert np.array_equal(np.load(tmp_path / 'indices.npy'), nu_scalar_quantize(data, LEVELS))
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64, np.int16])
+def test_raw_binary_round_trip(tmp_path, dtype):
+    data = (SIGNALS['normal'] * 100).astype(dtype)
+    data.tofile(tmp_path / 'signal.raw')
+    signal = load_signal(tmp_path / 'signal.raw', dtype=dtype)
+    assert signal.dtype == dtype and np.array_equal(signal, data)
+    trained = lbg_train(signal, 4)
+    assert trained['mse'] == pytest.approx(direct_mse(data.astype(np.float64), trained['levels']))
+
+
+def test_shared_memory_round_trip():
+    data = SIGNALS['normal'].reshape(100, 200)
+    shm, shared = share_array(data)
+    indices_shm, indices = share_array(np.zeros(data.shape, dtype=np.uint8))
+    try:
+        # another process would attach by name the same way
+        attached_shm, attached = attach_shared_array(shm.name, data.shape, data.dtype)
+        out_shm, out = attach_shared_array(indices_shm.name, data.shape, np.uint8)
+        assert np.array_equal(attached, data)
+        nu_scalar_quantize(attached, LEVELS, out=out)
+        assert np.array_equal(indices, nu_scalar_quantize(data, LEVELS))
+        del attached, out
+        attached_shm.close()
+        out_shm.close()
+    finally:
+        del shared, indices
+        for block in (shm, indices_shm):
+            block.close()
+            block.unlink()
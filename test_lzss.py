@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import lzss
+from lzss import LEVELS, MAX_MATCH, MIN_MATCH, lzss_decode, lzss_tokens
+
+rng = np.random.default_rng(0)
+with open(lzss.__file__, 'rb') as f:
+    SOURCE = f.read()
+INPUTS = {
+    'empty': b'',
+    'one byte': b'a',
+    'two bytes': b'ab',
+    'overlapping': b'ab' * 500 + b'a' * 1000,
+    'random': bytes(rng.integers(0, 256, 3000, dtype=np.uint8)),
+    'small alphabet': bytes(rng.integers(0, 3, 3000, dtype=np.uint8)),
+    'source': SOURCE[:6000],
+}
+
+
+def check_tokens(data, symbols, distances, window_size):
+    lengths = [symbol - 256 + MIN_MATCH for symbol in symbols if symbol >= 256]
+    assert len(lengths) == len(distances)
+    assert all(MIN_MATCH <= length <= MAX_MATCH for length in lengths)
+    assert all(1 <= distance <= window_size for distance in distances)
+    assert lzss_decode(symbols, distances) == data
+
+
+@pytest.mark.parametrize('level', sorted(LEVELS))
+@pytest.mark.parametrize('name', INPUTS)
+def test_round_trip(level, name):
+    data = INPUTS[name]
+    check_tokens(data, *lzss_tokens(data, 32768, level), 32768)
+
+
+@pytest.mark.parametrize('window_size', [1, 2, 3, 100, 4096])
+def test_window_bounds_distances(window_size):
+    data = SOURCE[:6000]
+    check_tokens(data, *lzss_tokens(data, window_size, 6), window_size)
+
+
+def test_overlapping_match():
+    # a run is one literal and a match reaching into its own output
+    symbols, distances = lzss_tokens(b'x' * 200, 32768, 1)
+    assert symbols == [ord('x'), 256 + 199 - MIN_MATCH] and distances == [1]
+    assert lzss_decode(symbols, distances) == b'x' * 200
+
+
+def test_higher_levels_find_more():
+    sizes = [len(lzss_tokens(SOURCE, 32768, level)[0]) for level in (1, 6, 9)]
+    assert sizes[0] >= sizes[1] >= sizes[2]
+    assert sizes[2] < len(SOURCE) // 2
+
+
+def test_lazy_matching_defers_to_a_longer_match():
+    # at the last 'abcde' greedy takes 'abc' and two literals, lazy a literal
+    # and 'bcde'
+    data = b'abcX bcdeY abcde'
+    greedy, _ = lzss_tokens(data, 32768, 3)
+    lazy, lazy_distances = lzss_tokens(data, 32768, 5)
+    assert len(lazy) < len(greedy)
+    assert lzss_decode(lazy, lazy_distances) == data
+
+
+@pytest.mark.parametrize('window_size, level', [(0, 6), (lzss.MAX_WINDOW + 1, 6), (32768, 0), (32768, 10)])
+def test_bad_settings(window_size, level):
+    with pytest.raises(ValueError):
+        lzss_tokens(b'abc', window_size, level)
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+import huffman
+import model_cache
+
+from arithmetic_encoder import arithmetic_decode_packed, arithmetic_encode_packed, build_cumulative_counts
+from model_cache import ModelCache, train_arithmetic_model, train_huffman_model
+
+SAMPLE = 'the quick brown fox jumps over the lazy dog ' * 20
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz .,'
+LENGTHS = [0, 1, 2, 5, 15, 16, 20, 50, 200, 2000]
+
+
+def messages(length, count=20):
+    rng = random.Random(length)
+    return [''.join(rng.choice(ALPHABET) for _ in range(length)) for _ in range(count)]
+
+
+@pytest.mark.parametrize('train', [train_huffman_model, train_arithmetic_model])
+@pytest.mark.parametrize('length', LENGTHS)
+def test_round_trip(train, length):
+    cache = ModelCache()
+    model_id = cache.add(train(SAMPLE, ALPHABET))
+    for text in messages(length):
+        assert cache.decode(cache.encode(model_id, text)) == text
+
+
+def test_arithmetic_model_compresses():
+    cache = ModelCache()
+    model_id = cache.add(train_arithmetic_model(SAMPLE, ALPHABET))
+    text = SAMPLE[:200]
+    # 4 byte id, 2 byte length, then about the sample's entropy per character
+    assert len(cache.encode(model_id, text)) < 6 + len(text) * 5 // 8
+
+
+def test_model_ids_are_stable():
+    assert train_huffman_model(SAMPLE).model_id == train_huffman_model(SAMPLE).model_id
+    assert train_arithmetic_model(SAMPLE).model_id == train_arithmetic_model(SAMPLE).model_id
+    assert train_arithmetic_model(SAMPLE).model_id != train_arithmetic_model(SAMPLE + 'x').model_id
+
+
+def test_unknown_character():
+    cache = ModelCache()
+    model_id = cache.add(train_arithmetic_model('abc'))
+    with pytest.raises(ValueError):
+        cache.encode(model_id, 'abz')
+
+
+def test_least_recently_used_is_evicted():
+    cache = ModelCache(capacity=2)
+    first = cache.add(train_huffman_model('aab'))
+    second = cache.add(train_huffman_model('abb'))
+    cache.get(first)
+    third = cache.add(train_huffman_model('abc'))
+    assert first in cache and third in cache and second not in cache
+    with pytest.raises(KeyError):
+        cache.get(second)
+
+
+def test_skewed_counts_keep_every_symbol():
+    cumulative_counts = build_cumulative_counts({'a': 10 ** 7, 'b': 1, 'c': 3})
+    assert all(high > low for low, high in cumulative_counts.values())
+    text = 'a' * 5000 + 'bcb' + 'a' * 5000
+    packed, _ = arithmetic_encode_packed(text, cumulative_counts)
+    assert arithmetic_decode_packed(packed, cumulative_counts, len(text)) == text
+
+
+def test_huffman_decode_reuses_the_model(monkeypatch):
+    cache = ModelCache()
+    model_id = cache.add(train_huffman_model(SAMPLE, ALPHABET))
+    encoded = [cache.encode(model_id, text) for text in messages(60)]
+
+    def rebuilt(*args):
+        raise AssertionError("decoding rebuilt a model table")
+    monkeypatch.setattr(huffman, 'build_decode_table', rebuilt)
+    monkeypatch.setattr(huffman, 'generate_code_table', rebuilt)
+    assert [cache.decode(message) for message in encoded] == messages(60)
+
+
+@pytest.mark.parametrize('train', [train_huffman_model, train_arithmetic_model])
+def test_colliding_ids_are_rejected(monkeypatch, train):
+    monkeypatch.setattr(model_cache, '_model_id', lambda kind, items: 7)
+    cache = ModelCache()
+    model_id = cache.add(train(SAMPLE))
+    assert cache.add(train(SAMPLE)) == model_id  # the same model again is fine
+    with pytest.raises(ValueError):
+        cache.add(train('aab'))
+    with pytest.raises(ValueError):
+        cache.add((train_arithmetic_model if train is train_huffman_model else train_huffman_model)(SAMPLE))
+    assert cache.get(model_id).same_as(train(SAMPLE))
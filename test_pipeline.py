@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+import pipeline
+from pipeline import (ArithmeticStage, BWTStage, HuffmanStage, MTFStage, Pipeline, RLEStage,
+                      bwt_pipeline, deflate_pipeline)
+
+rng = np.random.default_rng(0)
+with open(pipeline.__file__, 'rb') as f:
+    SOURCE = f.read()
+INPUTS = {
+    'empty': b'',
+    'single': b'a',
+    'one symbol': b'z' * 1000,
+    'all bytes': bytes(range(256)) * 4,
+    'random': bytes(rng.integers(0, 256, 5000, dtype=np.uint8)),
+    'runs': bytes(np.repeat(rng.integers(0, 4, 300, dtype=np.uint8), rng.integers(1, 40, 300))),
+    'source': SOURCE,
+}
+PIPELINES = {
+    'bwt huffman': lambda: bwt_pipeline('huffman', block_size=3000),
+    'bwt arithmetic': lambda: bwt_pipeline('arithmetic', block_size=3000),
+    'deflate': lambda: deflate_pipeline(window_size=1024, level=6, block_size=3000),
+}
+
+
+@pytest.mark.parametrize('pipeline', PIPELINES)
+@pytest.mark.parametrize('name', INPUTS)
+def test_round_trip(pipeline, name):
+    pipeline = PIPELINES[pipeline]()
+    data = INPUTS[name]
+    assert pipeline.decompress(pipeline.compress(data)) == data
+
+
+@pytest.mark.parametrize('pipeline', PIPELINES)
+@pytest.mark.parametrize('name', INPUTS)
+def test_never_expands(pipeline, name):
+    # blocks the stages cannot shrink are stored: a mode byte and a length
+    data = INPUTS[name]
+    blocks = -(-len(data) // 3000)
+    assert len(PIPELINES[pipeline]().compress(data)) <= len(data) + 3 * blocks
+
+
+def test_arithmetic_beats_huffman():
+    text = ''.join(rng.choice(list('abcd'), 20000, p=[0.7, 0.2, 0.05, 0.05]))
+    huffman = sum(map(len, HuffmanStage().encode(text)))
+    arithmetic = sum(map(len, ArithmeticStage().encode(text)))
+    # about 1.26 bits per symbol against Huffman's 1.4
+    assert arithmetic < huffman * 0.92
+    assert ArithmeticStage().decode(*ArithmeticStage().encode(text)) == text
+
+
+def test_compresses_text():
+    huffman = len(bwt_pipeline('huffman').compress(SOURCE))
+    assert len(bwt_pipeline('arithmetic').compress(SOURCE)) <= huffman < len(SOURCE) // 2
+    assert len(deflate_pipeline().compress(SOURCE)) < len(SOURCE) // 2
+
+
+@pytest.mark.parametrize('length', [0, 1, 2, 3, 6, 7, 100, 1000])
+def test_zero_runs(length):
+    block = 'ab' + '\0' * length + '\1' + '\0' * length
+    coded, header = RLEStage().encode(block)
+    assert RLEStage().decode(coded, header) == block
+    # a run of n zeros takes about log2(n) symbols, other symbols one each
+    assert len(coded) <= 3 + 2 * int(np.log2(length + 1))
+
+
+def test_rle_helps_the_bwt_pipeline():
+    without_rle = Pipeline([BWTStage(), MTFStage(), HuffmanStage()])
+    assert len(bwt_pipeline().compress(SOURCE)) < len(without_rle.compress(SOURCE))
+
+
+def test_report_follows_the_coded_size():
+    pipeline = bwt_pipeline()
+    compressed = pipeline.compress(SOURCE)
+    stats = pipeline.stats
+    assert stats['Huffman']['coded_out'] < len(compressed)  # framing left out
+    assert stats['RLE']['coded_out'] < stats['RLE']['coded_in']
+    assert stats['MTF']['coded_out'] < stats['BWT']['coded_out']
+    assert 'RLE' in pipeline.report()
@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+import pytest
+
+import profiling
+from huffman import build_frequency_dict, build_huffman_tree, generate_huffman_codes
+from lossy import lbg_compression, rate_distortion_curve
+
+
+@pytest.fixture
+def stats():
+    profiling.reset()
+    profiling.enable()
+    yield profiling.get_stats
+    profiling.disable()
+    profiling.reset()
+
+
+@profiling.instrument('inner')
+def inner(size):
+    profiling.add_iterations(2)
+    time.sleep(0.02)
+    return len([0] * size)
+
+
+@profiling.instrument('outer')
+def outer(size):
+    profiling.add_bytes(size)
+    profiling.add_iterations()
+    kept = [1] * size
+    inner(size * 4)
+    time.sleep(0.02)
+    return kept
+
+
+def test_nested_time_is_not_counted_twice(stats):
+    outer(10)
+    result = stats()
+    assert result['inner']['calls'] == result['outer']['calls'] == 1
+    assert result['inner']['iterations'] == 2 and result['outer']['iterations'] == 1
+    assert result['outer']['bytes'] == 10 and result['inner']['bytes'] == 0
+    assert 0.015 < result['outer']['seconds'] < result['outer']['total_seconds']
+    assert result['outer']['total_seconds'] >= result['outer']['seconds'] + result['inner']['seconds']
+
+
+def test_nested_allocations_are_kept_apart(stats):
+    profiling.enable(allocations=True)
+    outer(100000)
+    result = stats()
+    # the inner list, freed before returning, is four times the outer one
+    assert 3 < result['inner']['allocated_bytes'] / result['outer']['allocated_bytes'] < 5
+
+
+def test_disabled_records_nothing():
+    profiling.reset()
+    outer(10)
+    assert profiling.get_stats() == {}
+
+
+def test_lbg_phases(stats):
+    data = np.random.default_rng(0).normal(size=10000)
+    rate_distortion_curve(data, 8)
+    lbg_compression(data, 4)
+    result = stats()
+    assert result['LBG rate-distortion']['iterations'] > 0
+    assert result['LBG rate-distortion']['bytes'] == data.nbytes
+    assert result['LBG training']['calls'] == 1
+    assert result['LBG quantization']['seconds'] < result['LBG quantization']['total_seconds']
+
+
+def test_huffman_phases(stats):
+    text = 'abracadabra'
+    generate_huffman_codes(build_huffman_tree(build_frequency_dict(text)))
+    result = stats()
+    assert result['frequency counting']['bytes'] == len(text)
+    assert result['tree build']['bytes'] == 0 and result['code generation']['bytes'] == 0
+    assert 'frequency counting' in profiling.format_stats()